@@ -1,11 +1,13 @@
 #include "multimax_spi.h"
+#include <util/crc16.h>
 
 // Constructor of the MMAX6675 class
 MMAX6675::MMAX6675(
     int8_t CS_1, int8_t CS_2, int8_t CS_3, int8_t CS_4, 
     int8_t CS_5, int8_t CS_6, unsigned int maxItems
     ): 
-    dataQueue(maxItems) // Initialization of dataQueue with the specified maximum size
+    dataQueue(maxItems), // Initialization of dataQueue with the specified maximum size
+    seq_counter(0)
 {
     cs_pins[0] = CS_1;
     cs_pins[1] = CS_2;
@@ -28,7 +30,7 @@ MMAX6675::MMAX6675(
 // Method to register temperatures
 int MMAX6675::regTemperatures(void) {
     uint16_t vals[6]; // Array to store raw values read from the sensors
-    float out_vals[6]; // Array to store converted temperatures
+    measure data; // New measurement
 
     // Read raw values from the sensors
     for (int i = 0; i <= 5; i++){
@@ -42,19 +44,21 @@ int MMAX6675::regTemperatures(void) {
         digitalWrite(cs_pins[i], HIGH); // Deselect sensor i
     }
 
-    // Convert raw values to temperatures
+    // Keep the raw 12-bit temperature readings, conversion to Celsius is done when sending them
+    data.stamp = millis();
+    data.seq = seq_counter++; // the counter also advances for lost measurements, so gaps can be detected
+    data.open = 0;
     for (int i = 0; i <= 5; i++){
-        if (vals[i] & 0x4) // Check if no thermocouple is attached
-            vals[i] = NAN; // If no thermocouple, assign a NAN (Not a Number) value
+        if (vals[i] & 0x4){ // Check if no thermocouple is attached
+            data.raw[i] = 0;
+            data.open |= (1 << i);
+        }
         else
-            vals[i] >>= 3; // Bit shifting to get temperature in Celsius
-
-        out_vals[i] =  vals[i] * 0.25; // Conversion to Celsius
+            data.raw[i] = vals[i] >> 3; // Bit shifting to get the 12-bit temperature reading
     }
 
     // If the queue is not full, enqueue the new temperature measurement
     if (! dataQueue.isFull()){
-        measure data = {out_vals[0],out_vals[1],out_vals[2], out_vals[3], out_vals[4],out_vals[5]}; 
         dataQueue.enqueue(data); // Enqueue the new temperature measurement
         return 1; // Return 1 to indicate that a new measurement has been registered
     }
@@ -62,21 +66,56 @@ int MMAX6675::regTemperatures(void) {
         return 0; // Return 0 to indicate that the queue is full and the new measurement could not be registered
 }
 
+// Method to restart the sequence numbers
+void MMAX6675::reset_sequence(void) {
+    seq_counter = 0;
+}
+
 // Method to get measurements in JSON string format
 String MMAX6675::get_measurements(){
     measure data = dataQueue.dequeue(); // Extract the oldest measurement from the queue
-    // Create a JSON string with the measurements
-    String message = 
-        "{\"T1\":" + String(data.T1) + ","
-        + "\"T2\":" + String(data.T2) + ","
-        + "\"T3\":" + String(data.T3) + ","
-        + "\"T4\":" + String(data.T4) + ","
-        + "\"T5\":" + String(data.T5) + ","
-        + "\"T6\":" + String(data.T6) + "}";
+    // Create a JSON string with the measurements, open thermocouples are reported as NaN
+    String message = "{\"seq\":" + String(data.seq) + ",\"t\":" + String(data.stamp);
+    for (int i = 0; i <= 5; i++){
+        message += ",";
+        message += "\"T" + String(i + 1) + "\":";
+        if (data.open & (1 << i))
+            message += "NaN";
+        else
+            message += String(data.raw[i] * 0.25); // Conversion to Celsius
+    }
+    message += "}";
 
     return message; // Return the JSON string with the measurements
 }
 
+// Method to send the oldest measurement as a binary frame (see FRAME_SIZE in multimax_spi.h)
+void MMAX6675::write_frame(Print &port){
+    measure data = dataQueue.dequeue(); // Extract the oldest measurement from the queue
+    uint8_t frame[FRAME_SIZE];
+    uint16_t crc = 0;
+    int n = 0;
+
+    frame[n++] = FRAME_SYNC_1;
+    frame[n++] = FRAME_SYNC_2;
+    frame[n++] = data.seq & 0xFF;
+    frame[n++] = data.seq >> 8;
+    for (int i = 0; i < 4; i++)
+        frame[n++] = (data.stamp >> (8 * i)) & 0xFF;
+    for (int i = 0; i <= 5; i++){
+        frame[n++] = data.raw[i] & 0xFF;
+        frame[n++] = data.raw[i] >> 8;
+    }
+    frame[n++] = data.open;
+
+    for (int i = 2; i < n; i++)
+        crc = _crc_xmodem_update(crc, frame[i]);
+    frame[n++] = crc & 0xFF;
+    frame[n++] = crc >> 8;
+
+    port.write(frame, FRAME_SIZE);
+}
+
 
 // Method to clear dataQueue by dequeuing all its elements recursively.
 void MMAX6675::clear_queue() {
@@ -15,14 +15,19 @@ is handled by the MMAX6675 class (Multi MAX6675).
 #include <ArduinoQueue.h> 
 #include "SPI.h"
 
+// Binary frame sent in binary mode (little endian, 23 bytes):
+// sync (0xA5 0x5A) | seq (uint16) | stamp (uint32) | 6 raw readings (uint16) | open bits (uint8) | CRC-16/XMODEM (uint16)
+// The CRC covers every byte between the sync bytes and the CRC itself.
+#define FRAME_SYNC_1 0xA5
+#define FRAME_SYNC_2 0x5A
+#define FRAME_SIZE 23
+
 // Structure to store measurements from 6 thermocouples
 typedef struct measure {
-    float T1; // Temperature measurement for thermocouple 1
-    float T2; // Temperature measurement for thermocouple 2
-    float T3; // Temperature measurement for thermocouple 3
-    float T4; // Temperature measurement for thermocouple 4
-    float T5; // Temperature measurement for thermocouple 5
-    float T6; // Temperature measurement for thermocouple 6
+    uint16_t seq;    // Sequence number of the measurement since START
+    uint32_t stamp;  // millis() at which the measurement was taken
+    uint16_t raw[6]; // Raw 12-bit readings of thermocouples 1 to 6 (0.25 °C per unit)
+    uint8_t open;    // Bit i is set when no thermocouple is attached to channel i + 1
 } measure;
 
 // Class for handling multiple MAX6675 sensors
@@ -42,9 +47,15 @@ public:
     // Method to register temperatures
     int regTemperatures(void);
 
+    // Method to restart the sequence numbers (on START)
+    void reset_sequence(void);
+
     // Method to retrieve measurements
     String get_measurements();
 
+    // Method to send the oldest measurement as a binary frame
+    void write_frame(Print &port);
+
     // Queue for storing measurements
     ArduinoQueue<measure> dataQueue; // Definition of data Queue
 
@@ -55,6 +66,7 @@ public:
 
 private:
     int8_t cs_pins[6]; // Array to store CS pin numbers
+    uint16_t seq_counter; // Sequence number of the next measurement
     ArduinoQueue<measure>* aux_dataQueue; // Pointer for resizing queue
 };
 
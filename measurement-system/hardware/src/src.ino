@@ -12,19 +12,20 @@ MMAX6675 measure_system(T1_CS_PIN, T2_CS_PIN, T3_CS_PIN, T4_CS_PIN, T5_CS_PIN, T
 
 // Variables for controlling the measurement process
 bool start = 0; // Flag to indicate whether measurements should be started or stopped
-long int _time, prev_time; // Variables to keep track of time
+unsigned long _time, next_time; // Current time and time of the next measurement
 unsigned int sampling_time = 250; // Default sampling time (milliseconds), initially set to 1 second
 unsigned int analysis_time = 10000; // Default analysis time (milliseconds), initially set to 10 second
 int analysis_max_counter;
 int analysis_counter;
+bool binary_mode = 0; // Measurements are sent as binary frames instead of JSON lines
 
 void setup()
 {
     // Initialize serial communication
     Serial.begin(115200);
 
-    // Initialize previous time
-    prev_time = millis();
+    // Initialize time of the next measurement
+    next_time = millis();
     update_analysis_max_counter();
     analysis_counter = 0;
 }
@@ -35,8 +36,9 @@ void loop()
     if (start){
       // Get current time
       _time = millis();
-      // Check if it's time to take a new measurement (every 1000 milliseconds)
-      if (_time - prev_time > sampling_time){
+      // Check if it's time to take a new measurement. The schedule is absolute (next_time advances by
+      // exactly sampling_time) so the period does not drift with the time spent in loop() or serialEvent()
+      if ((long)(_time - next_time) >= 0){
           if (analysis_counter < analysis_max_counter){ // take data during the analysis time
             // Register temperatures and check if successfull
             if (!measure_system.regTemperatures()){
@@ -44,7 +46,10 @@ void loop()
                 Serial.println("BF"); // Error code BF (Buffer Full)
                 start = 0;
             }
-            prev_time = _time; // Update previous time
+            next_time += sampling_time; // Update time of the next measurement
+            // if loop() was held up for more than a period the missed slots are skipped, keeping the phase
+            while ((long)(_time - next_time) >= 0)
+              next_time += sampling_time;
             analysis_counter++;
           }else{
             start = 0;
@@ -61,6 +66,9 @@ void serialEvent(){
   // Process incoming commands
   if (command == "START") {
     analysis_counter = 0;
+    measure_system.clear_queue(); // samples left from a previous run would be numbered as this one's
+    measure_system.reset_sequence();
+    next_time = millis() + sampling_time; // first measurement one period after START
     start = 1; // Start measurement process
     Serial.println("STAOK"); // started OK
   }
@@ -72,11 +80,54 @@ void serialEvent(){
     // Check if data queue is not empty
 
     if (!measure_system.dataQueue.isEmpty()) {
-        Serial.println(measure_system.get_measurements()); // Get and print measurements
+        if (binary_mode)
+          send_measurements(1);
+        else
+          Serial.println(measure_system.get_measurements()); // Get and print measurements
     } else {
         Serial.println("BE"); // Error code BE (Buffer Empty)
     }
   }
+  else if (command == "GETALL" || command.startsWith("GETN")) {
+    // Drain the data queue in a single response.
+    // The format should be "GETALL" or "GETN XXX" where XXX is the maximum number of measurements
+    unsigned int n_items = measure_system.dataQueue.itemCount();
+
+    if (command.startsWith("GETN")) {
+      int max_items = command.substring(4).toInt();
+      if (max_items > 0 && (unsigned int) max_items < n_items)
+        n_items = max_items;
+    }
+
+    if (n_items > 0 || start) {
+      send_measurements(n_items); // an empty batch while measuring: no new data yet
+    } else {
+      Serial.println("BE"); // Error code BE (Buffer Empty)
+    }
+  }
+
+  else if (command == "STATUS") {
+    // Queue occupancy and capacity, the format is "ST <items> <capacity>"
+    Serial.print("ST ");
+    Serial.print(measure_system.dataQueue.itemCount());
+    Serial.print(" ");
+    Serial.println(measure_system.dataQueue.maxQueueSize());
+  }
+
+  else if (command.startsWith("MODE")) {
+    // The format should be "MODE BIN" or "MODE JSON"
+    String mode = command.substring(4);
+    mode.trim();
+    if (mode == "BIN") {
+      binary_mode = 1;
+      Serial.println("MBOK"); // Mode Binary OK
+    } else if (mode == "JSON") {
+      binary_mode = 0;
+      Serial.println("MJOK"); // Mode JSON OK
+    } else {
+      Serial.println("MNOK"); // Error code MNOK (Mode no OK)
+    }
+  }
 
   else if (command.startsWith("SETS")) {
     // Extract sampling time from the command
@@ -124,6 +175,22 @@ void serialEvent(){
   }
 }
 
+// Send the n_items oldest measurements in the current mode:
+// JSON mode: one JSON line per measurement followed by "EOB" (End Of Batch)
+// binary mode: a "B <n_items>" line followed by n_items binary frames
+void send_measurements(unsigned int n_items){
+  if (binary_mode) {
+    Serial.print("B ");
+    Serial.println(n_items);
+    for (unsigned int i = 0; i < n_items; i++)
+      measure_system.write_frame(Serial);
+  } else {
+    for (unsigned int i = 0; i < n_items; i++)
+      Serial.println(measure_system.get_measurements()); // Get and print measurements
+    Serial.println("EOB"); // End Of Batch
+  }
+}
+
 void update_analysis_max_counter (){
   analysis_max_counter =  ceil( analysis_time / sampling_time);
 }
\ No newline at end of file
@@ -0,0 +1,146 @@
+import asyncio
+from collections import deque
+
+from PyQt5 import QtCore
+
+from tmsdevice import CommandResult, TMSDevice, PORT_FAILED
+from tmsprotocol import BUFFER_EMPTY, BUFFER_FULL
+
+
+class AcquisitionThread(QtCore.QThread):
+    """Worker thread that owns the serial ports of one or more TMS devices.
+
+    The thread runs an asyncio event loop driving a TMSDevice per port, so
+    every read and write on the ports happens here and each device has its
+    own reader without a thread per port. Commands from the GUI are sent to
+    every device with request() and answered through a concurrent Future;
+    they are written in the order they were submitted. When polling is
+    enabled each device queue is drained every poll interval. Parsed batches
+    are pushed to the `samples` deque as (device index, values, failed)
+    tuples (append/popleft are atomic, no lock is needed) that the GUI
+    thread drains when it renders.
+    """
+
+    acquisition_stopped = QtCore.pyqtSignal(str)
+
+    def __init__(self, serial_ports, binary=False, log=None, parent=None):
+        super(AcquisitionThread, self).__init__(parent)
+        # called from this thread for every request/response, it must be thread-safe (see SerialLog)
+        self.log = log or (lambda message, level=None: None)
+        self.samples = deque()
+        self.loop = asyncio.new_event_loop()
+        self.devices = [
+            TMSDevice(port, binary, log=self._device_log(port, len(serial_ports) > 1))
+            for port in serial_ports
+        ]
+        self._polling_tasks = [None] * len(self.devices)
+
+    def _device_log(self, port, prefix):
+        if not prefix:
+            return self.log
+        return lambda message, *level: self.log(port.port + " " + message, *level)
+
+    # --------------------------------- GUI thread interface ---------------------------------------
+    def submit(self, coroutine):
+        """Run a coroutine on the acquisition loop; returns a concurrent Future."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def request(self, command, timeout=None):
+        """Send a command to every device; the Future resolves to the list of
+        replies (or exceptions), one per device."""
+        return self.submit(self._broadcast(command, timeout))
+
+    async def _broadcast(self, command, timeout):
+        return await asyncio.gather(
+            *(device.command(command, timeout) for device in self.devices),
+            return_exceptions=True,
+        )
+
+    def pipeline(self, commands, timeout=None, retries=0):
+        """Send the commands back to back to every device; the Future resolves
+        to a CommandResult once all of them are answered or out of retries."""
+        return self.submit(self._pipeline(commands, timeout, retries))
+
+    async def _pipeline(self, commands, timeout, retries):
+        started = self.loop.time()
+        replies = await asyncio.gather(
+            *(device.pipeline(commands, timeout, retries) for device in self.devices)
+        )
+        result = CommandResult(commands, self.loop.time() - started)
+        for device_replies in replies:
+            for command, reply in zip(commands, device_replies):
+                result.replies[command].append(reply)
+        return result
+
+    def start_offsets(self, interval_ms):
+        """Samples by which each device started after the first one, from the
+        time their STAOK replies were received."""
+        started = [device.started_at for device in self.devices]
+        first = min(started)
+        return [int(round((t - first) * 1000.0 / interval_ms)) for t in started]
+
+    def start_polling(self, interval_ms, max_interval_ms=None):
+        """Drain the devices sampling every interval_ms; with max_interval_ms the
+        polls adapt to the device queue fill level (see TMSDevice.samples)."""
+        max_interval = max_interval_ms / 1000.0 if max_interval_ms is not None else None
+        self.loop.call_soon_threadsafe(self._start_polling, interval_ms / 1000.0, max_interval)
+
+    def stop_polling(self):
+        # commands submitted after this call are sent once no more polls can be issued
+        for device in self.devices:
+            self.loop.call_soon_threadsafe(device.stop_sampling)
+
+    @property
+    def failed(self):
+        """Whether the port of a device failed; it answers no more commands."""
+        return any(device.error is not None for device in self.devices)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.wait()
+
+    def drain(self):
+        """Take every (device index, values, failed) batch received since the last call."""
+        batches = []
+        while self.samples:
+            batches.append(self.samples.popleft())
+        return batches
+
+    # ---------------------------------- acquisition thread ----------------------------------------
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        # every device is open before the commands already submitted get to run
+        self.loop.run_until_complete(asyncio.gather(*(device.open() for device in self.devices)))
+        self.loop.run_forever()
+
+        for device in self.devices:
+            device.close()
+        tasks = asyncio.all_tasks(self.loop)
+        for task in tasks:
+            task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.loop.close()
+
+    def _start_polling(self, interval, max_interval):
+        for index in range(len(self.devices)):
+            self._polling_tasks[index] = self.loop.create_task(
+                self._poll(index, interval, max_interval, self._polling_tasks[index])
+            )
+
+    async def _poll(self, index, interval, max_interval, previous_task):
+        if previous_task is not None:
+            # a stopped polling task may still be finishing its last batch
+            await asyncio.gather(previous_task, return_exceptions=True)
+
+        device = self.devices[index]
+        async for values, failed in device.samples(interval, max_interval):
+            self.samples.append((index, values, failed))
+
+        if device.status == BUFFER_FULL or device.status == PORT_FAILED:
+            # the run is compromised as soon as one device overflows or is lost
+            self.acquisition_stopped.emit(device.status)
+
+        elif device.status == BUFFER_EMPTY:
+            # done once every device has finished its analysis time
+            if all(d.status == BUFFER_EMPTY for d in self.devices):
+                self.acquisition_stopped.emit(BUFFER_EMPTY)
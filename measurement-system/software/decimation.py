@@ -0,0 +1,254 @@
+from numpy import (
+    arange, broadcast_to, concatenate, empty, fmax, fmin, full, inf, isnan, log2, nan, take_along_axis, where, zeros
+)
+
+
+class MinMaxPyramid:
+    """Multi-resolution min/max summary of growing series, for zoom and pan.
+
+    Level L splits the samples in buckets of 2**L consecutive samples and
+    keeps, for every channel and bucket, the index of its lowest and highest
+    sample. Each level is built from the one below by merging pairs of
+    buckets, and only the buckets from the first sample written since the
+    last update on are computed again, so keeping the pyramid up to date
+    costs about twice the new samples.
+
+    A view of n samples over p pixels is served from the coarsest level that
+    still has a bucket per pixel, i.e. 2**L <= n / p: plotting the lowest and
+    highest sample of every bucket, in time order, looks the same as the full
+    series at that width, with at most four points per pixel whatever the
+    length of the recording. Levels below min_level are not stored, those
+    views have few samples and are summarized on the fly.
+    """
+
+    def __init__(self, min_level=4, max_level=40):
+        self.min_level = min_level
+        self.max_level = max_level
+        self._levels = []  # stored levels, from min_level up
+        self._valid = 0  # samples summarized in the stored levels
+
+    def clear(self):
+        self._levels = []
+        self._valid = 0
+
+    def invalidate(self, first_sample):
+        """Samples from first_sample on were written, their buckets are computed again."""
+        self._valid = min(self._valid, max(int(first_sample), 0))
+
+    def update(self, values):
+        # (channels x samples) array `values`, the samples up to the last update are known
+        n_samples = values.shape[1]
+        if n_samples == self._valid:
+            return
+        first = min(self._valid, n_samples)
+        for i, level in enumerate(range(self.min_level, self.max_level + 1)):
+            first_bucket, n_buckets = first >> level, n_samples >> level
+            if n_buckets == 0:
+                break
+            if i == 0:
+                size = 1 << level
+                stats = _merge(values, _samples(values, first_bucket * size, n_buckets * size), size)
+            else:
+                stats = _merge(values, self._levels[i - 1].get(2 * first_bucket, 2 * n_buckets), 2)
+            if i == len(self._levels):
+                self._levels.append(_Level(values.shape[0]))
+            self._levels[i].put(first_bucket, stats)
+        self._valid = n_samples
+
+    def indexes(self, values, start, stop, n_pixels):
+        """Indexes of the samples to plot for every row of the (channels x
+        samples) array `values` between samples start and stop; returns a
+        (channels x points) integer array."""
+        start, stop = max(start, 0), min(stop, values.shape[1])
+        level, first_bucket, (low, high) = self._buckets(values, start, stop, n_pixels)
+        tail = (first_bucket + low.shape[1]) << level
+        if tail < stop:
+            # the last, incomplete bucket is summarized the same way
+            tail_low, tail_high = _merge(values, _samples(values, tail, stop), stop - tail)
+            low, high = concatenate((low, tail_low), axis=1), concatenate((high, tail_high), axis=1)
+        indexes = empty((values.shape[0], 2 * low.shape[1]), dtype=int)
+        indexes[:, 0::2] = where(low < high, low, high)
+        indexes[:, 1::2] = where(low < high, high, low)
+        return indexes
+
+    def extrema(self, values, start, stop):
+        """Lowest and highest value of every channel between samples start
+        and stop, as (channels,) arrays (NaN for channels without valid
+        samples). The range is covered by at most two buckets per level plus
+        the raw samples at both ends, whatever its length."""
+        self.update(values)
+        start, stop = max(start, 0), min(stop, values.shape[1])
+        size = 1 << self.min_level
+        first, last = -(-start // size), stop // size
+        if first >= last:
+            samples = values[:, start:stop]
+            return fmin.reduce(samples, axis=1, initial=nan), fmax.reduce(samples, axis=1, initial=nan)
+
+        # standard bottom-up range walk over the stored levels, raw samples at both ends
+        indexes = [broadcast_to(arange(start, first * size), (values.shape[0], first * size - start)),
+                   broadcast_to(arange(last * size, stop), (values.shape[0], stop - last * size))]
+        level = 0
+        while first < last:
+            if first & 1:
+                indexes.extend(self._levels[level].get(first, first + 1))
+                first += 1
+            if last & 1:
+                last -= 1
+                indexes.extend(self._levels[level].get(last, last + 1))
+            first, last, level = first >> 1, last >> 1, level + 1
+        samples = take_along_axis(values, concatenate(indexes, axis=1), axis=1)
+        return fmin.reduce(samples, axis=1), fmax.reduce(samples, axis=1)
+
+    def _buckets(self, values, start, stop, n_pixels):
+        # level, first bucket and statistics of the complete buckets between start and stop
+        self.update(values)
+        samples_per_pixel = (stop - start) / max(int(n_pixels), 1)
+        level = int(log2(samples_per_pixel)) if samples_per_pixel >= 2 else 0
+        level = min(level, self.min_level + len(self._levels) - 1) if level >= self.min_level else level
+        first_bucket, last_bucket = start >> level, max(stop >> level, start >> level)
+        if level >= self.min_level:
+            return level, first_bucket, self._levels[level - self.min_level].get(first_bucket, last_bucket)
+        size = 1 << level
+        return level, first_bucket, _merge(values, _samples(values, first_bucket * size, last_bucket * size), size)
+
+
+class HeatmapRing:
+    """Preallocated (channels x width) image of a growing series, for imshow.
+
+    Every column is the mean of bin_size consecutive samples. update() only
+    writes the columns of the samples written since the previous call (the
+    last column is completed as samples arrive), so its cost does not depend
+    on the length of the session. When the image is full:
+
+    - binned: pairs of columns are merged and bin_size doubles, the image
+      keeps the whole session at a coarser time resolution;
+    - otherwise the buffer is a ring and the new columns overwrite the
+      oldest ones, the image scrolls over the last `width` bins.
+
+    The buffers are allocated on the first update, for its number of channels.
+    """
+
+    def __init__(self, width=1024, binned=True, bin_size=1):
+        self.width = width + width % 2  # merged by pairs
+        self.binned = binned
+        self.initial_bin_size = bin_size
+        self.clear()
+
+    def clear(self):
+        self.bin_size = self.initial_bin_size
+        self._total = self._count = self._image = None
+        self._bins = 0  # bins written, the last one may be incomplete
+        self._valid = 0  # samples summed in the columns
+
+    def invalidate(self, first_sample):
+        """Samples from first_sample on were written, their columns are computed again."""
+        self._valid = min(self._valid, max(int(first_sample), 0))
+
+    @property
+    def first_sample(self):
+        return max(self._bins - self.width, 0) * self.bin_size
+
+    @property
+    def stop_sample(self):
+        # end of the last column, past the last sample if that column is incomplete
+        return self._bins * self.bin_size
+
+    def update(self, values):
+        n_channels, n_samples = values.shape
+        if self._image is None or self._image.shape[0] != n_channels:
+            self._total = zeros((n_channels, self.width))
+            self._count = zeros((n_channels, self.width), dtype=int)
+            self._image = full((n_channels, self.width), nan)
+            self._bins = self._valid = 0
+        while self.binned and -(-n_samples // self.bin_size) > self.width:
+            self._merge()
+
+        last_bin = -(-n_samples // self.bin_size)
+        first_bin = max(min(self._valid, n_samples) // self.bin_size, last_bin - self.width)
+        if first_bin < last_bin:
+            start, stop = first_bin * self.bin_size, last_bin * self.bin_size
+            block = full((n_channels, stop - start), nan)
+            block[:, :n_samples - start] = values[:, start:n_samples]
+            block = block.reshape(n_channels, last_bin - first_bin, self.bin_size)
+            missing = isnan(block)
+            columns = arange(first_bin, last_bin) % self.width
+            self._total[:, columns] = where(missing, 0, block).sum(axis=2)
+            self._count[:, columns] = (~missing).sum(axis=2)
+            self._image[:, columns] = _mean(self._total[:, columns], self._count[:, columns])
+        self._bins = max(self._bins, last_bin)
+        self._valid = n_samples
+
+    def image(self):
+        # (channels x columns) array of the columns in time order
+        if self._image is None:
+            return empty((0, 0))
+        if self._bins <= self.width:
+            return self._image[:, :self._bins]
+        head = self._bins % self.width
+        return concatenate([self._image[:, head:], self._image[:, :head]], axis=1)
+
+    def _merge(self):
+        half = self.width // 2
+        for buffer in (self._total, self._count):
+            buffer[:, :half] = buffer[:, 0::2] + buffer[:, 1::2]
+            buffer[:, half:] = 0
+        self._image[:, :half] = _mean(self._total[:, :half], self._count[:, :half])
+        self._image[:, half:] = nan
+        self._bins = -(-self._bins // 2)
+        self.bin_size *= 2
+
+
+def _mean(total, count):
+    return where(count > 0, total / where(count > 0, count, 1), nan)
+
+
+class _Level:
+    # per bucket statistics of a level, in (channels x buckets) buffers that grow by doubling
+
+    def __init__(self, n_channels, capacity=1024):
+        self.size = 0
+        self._stats = _empty(n_channels, capacity)
+
+    def get(self, first, last):
+        return tuple(stat[:, first:last] for stat in self._stats)
+
+    def put(self, first, stats):
+        last = first + stats[0].shape[1]
+        if last > self._stats[0].shape[1]:
+            capacity = self._stats[0].shape[1]
+            while capacity < last:
+                capacity *= 2
+            grown = _empty(self._stats[0].shape[0], capacity)
+            for old, new in zip(self._stats, grown):
+                new[:, :self.size] = old[:, :self.size]
+            self._stats = grown
+        for stat, new in zip(self._stats, stats):
+            stat[:, first:last] = new
+        self.size = last
+
+
+def _empty(n_channels, capacity):
+    # lowest and highest sample indexes
+    return empty((n_channels, capacity), dtype=int), empty((n_channels, capacity), dtype=int)
+
+
+def _samples(values, first, last):
+    # statistics of single sample buckets
+    indexes = broadcast_to(arange(first, last), (values.shape[0], last - first))
+    return indexes, indexes
+
+
+def _merge(values, stats, factor):
+    # statistics of the buckets made of `factor` consecutive buckets of `stats`
+    low, high = stats
+    n_channels, n_buckets = low.shape[0], low.shape[1] // factor
+    shape = (n_channels, n_buckets, factor)
+    low, high = low.reshape(shape), high.reshape(shape)
+    low_values = take_along_axis(values, low.reshape(n_channels, -1), axis=1).reshape(shape)
+    high_values = take_along_axis(values, high.reshape(n_channels, -1), axis=1).reshape(shape)
+    low_arg = where(isnan(low_values), inf, low_values).argmin(axis=2)[:, :, None]
+    high_arg = where(isnan(high_values), -inf, high_values).argmax(axis=2)[:, :, None]
+    return (
+        take_along_axis(low, low_arg, axis=2)[:, :, 0],
+        take_along_axis(high, high_arg, axis=2)[:, :, 0],
+    )
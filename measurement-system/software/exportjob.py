@@ -0,0 +1,116 @@
+import multiprocessing
+import os
+import pickle
+import threading
+from pathlib import Path
+
+from matplotlib import rcParams
+from openpyxl.styles import Font
+from pandas import ExcelWriter
+from PyQt5 import QtCore
+
+
+class ExportJob(QtCore.QObject):
+    """Writes a set of files in a pool of worker processes.
+
+    Every task is (filename, function, args): a module level function
+    called in a worker with a snapshot of what it writes, taken by the GUI
+    thread when the job is made (a copy of the data, a pickled figure), so
+    the application keeps streaming and changing its figures meanwhile.
+    Processes are used rather than threads because openpyxl and Agg hold the
+    GIL, they would starve the GUI thread for the whole save. There are at
+    most as many workers as CPUs and they run at a lower priority, so the
+    GUI and the acquisition keep their share of a loaded machine.
+
+    `progress` is emitted with the number of tasks done and the file of the
+    last one, `finished` once every task is done with the errors by file
+    (empty if every file was written). cancel() terminates the workers and
+    removes the files of the job, including the ones already written.
+    """
+
+    progress = QtCore.pyqtSignal(int, str)
+    finished = QtCore.pyqtSignal(dict)
+    _joined = QtCore.pyqtSignal()
+
+    def __init__(self, tasks, processes=None, parent=None):
+        super(ExportJob, self).__init__(parent)
+        self.tasks = list(tasks)
+        self.processes = processes or max(min(len(self.tasks), os.cpu_count() or 1), 1)
+        self.errors = {}
+        self.done = 0
+        self.cancelled = False
+        self._pool = None
+        self._stopped = threading.Event()  # set once the workers exited
+        self._joined.connect(self._finish, QtCore.Qt.QueuedConnection)
+
+    def start(self):
+        # spawned, a forked copy of the GUI process would inherit its threads and Qt state
+        self._pool = multiprocessing.get_context("spawn").Pool(self.processes, initializer=_lower_priority)
+        for filename, function, args in self.tasks:
+            self._pool.apply_async(
+                function, args,
+                callback=lambda result, filename=filename: self._task_done(filename, None),
+                error_callback=lambda error, filename=filename: self._task_done(filename, error),
+            )
+        self._pool.close()
+        # the workers exit once the tasks are done, they are waited for out of the GUI thread
+        threading.Thread(target=self._join, args=(self._pool,), daemon=True).start()
+
+    def wait(self):
+        """Block until every task is done."""
+        if self._pool is not None:
+            self._stopped.wait()
+
+    def cancel(self):
+        if self._pool is None:
+            return
+        self.cancelled = True
+        self._pool.terminate()
+        self._pool = None
+        for filename, _, _ in self.tasks:
+            Path(filename).unlink(missing_ok=True)
+        self.finished.emit({})
+
+    def _task_done(self, filename, error):
+        # called from the result thread of the pool
+        if self.cancelled:
+            return
+        if error is not None:
+            self.errors[str(filename)] = str(error) or type(error).__name__
+        self.done += 1
+        self.progress.emit(self.done, str(filename))
+
+    def _join(self, pool):
+        pool.join()
+        self._stopped.set()
+        if not self.cancelled:
+            self._joined.emit()
+
+    def _finish(self):
+        if self._pool is None:
+            return
+        self._pool = None
+        self.finished.emit(dict(self.errors))
+
+
+def _lower_priority():
+    if hasattr(os, "nice"):
+        os.nice(10)
+
+
+def write_data_file(filename, data, header):
+    """Write the DataFrame `data` under the rows of `header` (the first one in bold) to an xlsx file."""
+    with ExcelWriter(filename, mode='w', engine='openpyxl') as writer:
+        data.to_excel(writer, index=False, startrow=7)
+        worksheet = writer.sheets['Sheet1']
+        for i, row in enumerate(header):
+            for j, value in enumerate(row):
+                cell = worksheet.cell(row=i+1, column=j+1, value=value)
+                if i == 0:
+                    cell.font = Font(bold=True, size=14)
+
+
+def save_figure(filename, figure, rc, dpi):
+    """Save a figure pickled by the GUI thread, drawn with the rcParams `rc`."""
+    rcParams.update(rc)
+    pickle.loads(figure).savefig(filename, dpi=dpi)
@@ -10,6 +10,7 @@
 
 import os
 import sys
+import multiprocessing
 import serial
 import json
 import warnings
@@ -17,13 +18,20 @@ import resources
 from PyQt5 import QtCore, QtWidgets
 from PyQt5.uic import loadUi
 from dialogwidgets import *
-from mplwidgets import linear_plots_styles
-from pandasmodel import PandasModel
+from mplwidgets import figure_configs, linear_plot_style
+from pandasmodel import SampleStoreModel
+from samplestore import SampleStore
+from acquisition import AcquisitionThread
+from tmsdevice import CommandResult, PORT_FAILED
+from seriallog import SerialLog, LEVELS
+from decimation import HeatmapRing, MinMaxPyramid
+from exportjob import ExportJob, save_figure, write_data_file
+from tmsprotocol import (
+    channel_names, BUFFER_EMPTY, BUFFER_FULL, BINARY_MODE, BINARY_MODE_OK, JSON_MODE, SEQUENCE_MODULO, STAMP_MODULO
+)
 from serial.tools import list_ports
-from numpy import zeros, arange
-from pandas import DataFrame, ExcelWriter
+from numpy import zeros, arange, ceil, column_stack, floor, fmax, fmin, isnan, searchsorted
 from pathlib import Path
-from openpyxl.styles import Font
 from datetime import datetime
 
 
@@ -36,6 +44,16 @@ class MS_interface(QtWidgets.QMainWindow):
     _linear_plot_refs = None
     _map_plot_ref = None
     _cbar = None
+    # a command future done on the acquisition thread, with the callback taking it on the GUI thread
+    command_done = QtCore.pyqtSignal(object, object)
+    streaming = False
+    save_job = None
+    save_progress = None
+    # resolution of the saved figures
+    export_dpi = 500
+    # room left at the right of the time axis, as a fraction of the plotted time span, so the limits
+    # (and with them the plot background) do not change on every sample
+    plot_headroom = 0.25
 
     def __init__(self):
         super(MS_interface, self).__init__()
@@ -82,8 +100,11 @@ class MS_interface(QtWidgets.QMainWindow):
         )
 
         # setting up COM interfaces 
-        self.serial_port = serial.Serial(timeout=3)
+        self.serial_ports = []
         self.serial_params = dict()
+        self.wire_binary = False
+        self.acquisition = None
+        self.command_done.connect(lambda callback, future: callback(future))
         self.baud_list = {
             "1200": 1200, "2400": 2400, "4800": 4800, "9600": 9600, "19200": 19200,
             "38400": 38400, "57600": 57600, "115200": 115200
@@ -106,11 +127,48 @@ class MS_interface(QtWidgets.QMainWindow):
         self.stopbits_combobox.addItems([*self.stop_bits_list])
         self.flowcontrol_combobox.addItems([*self.flowcontrol_list])
 
+        # several devices are acquired together by typing their ports separated by commas
+        self.COM_combobox.setEditable(True)
+        self.COM_combobox.setToolTip("Several TMS devices: type their ports separated by commas")
+        self.n_devices = 1
+
+        # serial monitor log, flushed to the widget at a fixed rate
+        self.monitor = SerialLog(
+            self.serial_monitor_textedit,
+            capacity=self.monitor_capacity,
+            level=LEVELS.get(self.monitor_level, LEVELS["INFO"]),
+            trace_file=self.trace_file or None,
+        )
+        self.monitor_level_combobox.addItems([*LEVELS])
+        self.monitor_level_combobox.setCurrentText(self.monitor_level)
+
+        # min/max summary of the samples, the time series plots at most four points per pixel of every channel
+        self.pyramid = MinMaxPyramid()
+        # fixed width image of the map, only the columns of new samples are written on each frame
+        self.heatmap = HeatmapRing(self.map_width, binned=self.map_binning)
+        # limits of each axes as rescale_lims left them, the view was panned or zoomed if they differ
+        self.view_limits = {}
+        # the plots follow the last samples or show the whole session, the map of the window is a ring
+        self.follow_plot_checkbox.setChecked(self.follow_plot)
+        self.follow_window_spinbox.setValue(self.follow_window / 1000)
+        self.reset_window_heatmap()
+
         # setting up data view interface
         self.reset_table_data()
 
         # seeting up grpah view interface
         self.reset_plot_data()
+        # zooming or panning with the toolbar decimates the lines again for the new range
+        self.linear_plot.axes.callbacks.connect("xlim_changed", lambda axes: self.decimate_lines())
+        for plot in (self.linear_plot, self.map_plot):
+            # the live view is drawn by matplotlib or painted by Qt, exports are always drawn by matplotlib
+            plot.set_renderer(self.plot_renderer)
+            plot.home_requested.connect(lambda: self.update_plots_data(reset_view=True))
+            # optionally the figures are drawn in worker threads, the GUI thread only paints the frames
+            plot.set_log(self.monitor.log)
+            plot.set_threaded(self.threaded_rendering)
+            # while streaming, each plot lowers its quality to draw within half of the frame time
+            plot.set_frame_budget(0.5 / self.max_fps)
         # ------------------------------ setting up singals-slots ----------------------------------
         # window buttons
         self.minimize_window_button.clicked.connect(lambda: self.showMinimized())
@@ -148,6 +206,15 @@ class MS_interface(QtWidgets.QMainWindow):
         self.COM_combobox.currentIndexChanged.connect(
             lambda: self.serial_combobox_selection("port")
         )
+        self.COM_combobox.lineEdit().editingFinished.connect(
+            lambda: self.serial_combobox_selection("port")
+        )
+        self.jump_time_spinbox.valueChanged.connect(lambda: self.jump_to_time())
+        self.follow_plot_checkbox.toggled.connect(lambda: self.set_plot_view())
+        self.follow_window_spinbox.valueChanged.connect(lambda: self.set_plot_view())
+        self.monitor_level_combobox.currentTextChanged.connect(
+            lambda level: self.monitor.set_level(LEVELS[level])
+        )
         self.baud_combobox.currentIndexChanged.connect(
             lambda: self.serial_combobox_selection("baudrate")
         )
@@ -172,11 +239,15 @@ class MS_interface(QtWidgets.QMainWindow):
         self.COM_connect_button.clicked.connect(lambda: self.connect_disconnect_COM(1))
         self.COM_disconnect_button.clicked.connect(lambda: self.connect_disconnect_COM(0))
         self.start_button.clicked.connect(self.start_streaming)
-        self.stop_button.clicked.connect(self.stop_streaming)
+        self.stop_button.clicked.connect(lambda: self.stop_streaming())
 
         # setting up a timer
         self.timer = QtCore.QTimer()
         self.timer.timeout.connect(self.timer_isr)
+        # render clock, independent of the acquisition: each frame draws everything ingested since the last one
+        self.render_timer = QtCore.QTimer()
+        self.render_timer.timeout.connect(self.render_frame)
+        self.render_pending = False
 
         # data buttons
         self.reset_button.clicked.connect(self.reset)
@@ -201,6 +272,21 @@ class MS_interface(QtWidgets.QMainWindow):
         self.analysis_time = self.default_params.get("analysis_time", 10000)
         self.buffer_size = self.default_params.get("buffer_size", 40)
         self.inital_data_size = self.default_params.get("initial_data_size", 10)
+        self.binary_mode = self.default_params.get("binary_mode", True)
+        self.command_timeout = self.default_params.get("command_timeout", 500)
+        self.command_retries = self.default_params.get("command_retries", 2)
+        self.poll_max_interval = self.default_params.get("poll_max_interval", 1000)
+        self.max_fps = self.default_params.get("max_fps", 20)
+        self.map_width = self.default_params.get("map_width", 1024)
+        self.plot_renderer = self.default_params.get("plot_renderer", "matplotlib")
+        self.threaded_rendering = self.default_params.get("threaded_rendering", False)
+        self.adaptive_quality = self.default_params.get("adaptive_quality", True)
+        self.map_binning = self.default_params.get("map_binning", True)
+        self.follow_plot = self.default_params.get("follow_plot", True)
+        self.follow_window = self.default_params.get("follow_window", 60000)
+        self.monitor_level = self.default_params.get("monitor_level", "INFO")
+        self.monitor_capacity = self.default_params.get("monitor_capacity", 2000)
+        self.trace_file = self.default_params.get("trace_file", "")
         self.params_to_apply = {
             "sampling_rate": self.sampling_rate,
             "plotting_rate": self.plotting_rate,
@@ -263,51 +349,149 @@ class MS_interface(QtWidgets.QMainWindow):
     def connect_disconnect_COM(self, state):
         if state:
             try:
-                self.serial_port.__init__(timeout=5, **self.serial_params)
-
-                self.serial_port.close()
-                self.serial_port.open()
+                ports = [port.strip() for port in self.serial_params["port"].split(",") if port.strip()]
+                self.serial_ports = []
+                for port in ports:
+                    self.serial_ports.append(serial.Serial(timeout=5, **dict(self.serial_params, port=port)))
+
+                if len(ports) != self.n_devices:
+                    self.n_devices = len(ports)
+                    self.reset_table_data()
+                    with self.linear_plot.holding(), self.map_plot.holding():
+                        self.reset_plot_data()
+                self.start_acquisition()
                 self.COM_disconnect_frame.show()    
                 self.COM_connect_frame.hide()
-                self.serial_monitor_textedit.appendPlainText(self.serial_params["port"] + " Connected...")
-                self.serial_monitor_textedit.appendPlainText("applying streaming parameters...")
+                self.monitor.info(self.serial_params["port"] + " Connected...")
+                self.negotiate_wire_mode()
+                self.monitor.info("applying streaming parameters...")
                 self.streaming_controls_frame.setEnabled(True)
                 self.apply_streaming_params()
 
             except Exception as e:
-                self.serial_monitor_textedit.appendPlainText(str(e))
-                self.serial_port.close()
+                self.monitor.warning(str(e))
+                self.stop_acquisition()
+                self.close_serial_ports()
 
+        elif self.streaming:
+            # the ports are closed once the devices answered STOP, or failed to
+            self.stop_streaming(then=self.disconnect_COM)
         else:
-            try:
-                self.stop_streaming()
-                self.serial_port.close()
-                self.COM_disconnect_frame.hide()
-                self.COM_connect_frame.show()
-                self.serial_monitor_textedit.appendPlainText(self.serial_params["port"] + " Disconnected...")
-                self.streaming_controls_frame.setEnabled(False)
+            self.disconnect_COM()
+
+
+    def disconnect_COM(self):
+        try:
+            if self.timer.isActive():
+                self.end_streaming()  # STOP was not answered, nothing is read from now on anyway
+            self.stop_acquisition()
+            self.close_serial_ports()
+            self.COM_disconnect_frame.hide()
+            self.COM_connect_frame.show()
+            self.monitor.info(self.serial_params["port"] + " Disconnected...")
+            self.streaming_controls_frame.setEnabled(False)
+
+        except Exception as e:
+            self.monitor.warning("Error trying to close " + self.serial_params["port"])
+
+
+    def close_serial_ports(self):
+        for serial_port in self.serial_ports:
+            serial_port.close()
+        self.serial_ports = []
+
+
+    def start_acquisition(self):
+        # from now on the serial ports are only used from the acquisition thread
+        self.acquisition = AcquisitionThread(self.serial_ports, self.wire_binary, self.monitor.log)
+        self.acquisition.acquisition_stopped.connect(self.acquisition_stopped)
+        self.acquisition.start()
 
-            except Exception as e:
-                self.serial_monitor_textedit.appendPlainText("Error trying to close " + self.serial_params["port"])
 
+    def stop_acquisition(self):
+        if self.acquisition is not None:
+            self.acquisition.stop()
+            self.acquisition = None
 
-    def arduino_request(self, command):
-        self.serial_monitor_textedit.appendPlainText("request: " + command)
-        self.serial_port.write(str.encode(command))
 
+    def when_done(self, future, callback):
+        # callback(future) is called from the GUI thread once the command future is done, the GUI thread
+        # never waits for the devices
+        future.add_done_callback(lambda future: self.command_done.emit(callback, future))
 
-    def arduino_response(self):
-        res = self.serial_port.readline().decode("utf-8")
 
+    def arduino_command(self, command, callback=None, timeout=None):
+        # the command runs on the acquisition loop, other commands (and polls) may be in flight meanwhile.
+        # It is sent to every device, callback gets the reply only if all of them agree (None otherwise)
+        if self.acquisition is None:
+            raise serial.PortNotOpenError()
+        self.when_done(
+            self.acquisition.request(command, timeout),
+            lambda future: self.command_replied(command, future, callback),
+        )
+
+
+    def command_replied(self, command, future, callback):
         try:
-            res = res.split("\r")[0]
-            self.serial_monitor_textedit.appendPlainText("response: " + res)
+            replies = future.result()
+        except Exception as e:
+            self.monitor.warning("Fail readed " + (str(e) or "no response to " + command))
+            replies = [e]
+
+        for reply in replies:
+            if isinstance(reply, Exception):
+                self.monitor.warning(
+                    "Fail readed " + (str(reply) or "no response to " + command)
+                )
+        reply = None
+        if len(set(map(str, replies))) == 1 and not isinstance(replies[0], Exception):
+            reply = replies[0]
+        if callback is not None:
+            callback(reply)
+
+
+    def arduino_pipeline(self, commands, callback):
+        # commands are sent back to back and their replies matched as they arrive, each one is
+        # resent up to command_retries times, so callback gets the CommandResult after about one round trip
+        # (bounded by the retries)
+        if self.acquisition is None:
+            raise serial.PortNotOpenError()
+        self.when_done(
+            self.acquisition.pipeline(commands, self.command_timeout / 1000, self.command_retries),
+            lambda future: self.pipeline_replied(commands, future, callback),
+        )
+
 
+    def pipeline_replied(self, commands, future, callback):
+        try:
+            result = future.result()
         except Exception as e:
-            self.serial_monitor_textedit.appendPlainText("Fail readed " + str(e))
-            return None
+            # a device failed, none of the commands counts as accepted
+            self.monitor.warning("Fail readed " + (str(e) or "no response to " + ", ".join(commands)))
+            result = CommandResult(commands)
+        else:
+            self.monitor.info(
+                "applied " + ", ".join(commands) + " in " + str(round(result.elapsed * 1000)) + " ms"
+            )
+        callback(result)
+
 
-        return res
+    def negotiate_wire_mode(self):
+        # binary frames are used only if the firmware acknowledges them, JSON lines otherwise. JSON is asked
+        # for too, the firmware keeps the mode of a previous connection
+        self.wire_binary = False
+        self.arduino_command(BINARY_MODE if self.binary_mode else JSON_MODE, self.wire_mode_replied, timeout=1)
+
+
+    def wire_mode_replied(self, reply):
+        if self.acquisition is None:
+            return  # disconnected meanwhile
+        # every device parses the frames in the mode it acknowledged
+        self.wire_binary = reply == BINARY_MODE_OK
+
+        self.monitor.info(
+            "wire protocol: " + ("binary" if self.wire_binary else "JSON")
+        )
 
 
     # responsives and widget
@@ -462,87 +646,177 @@ class MS_interface(QtWidgets.QMainWindow):
     def start_streaming(self):
         self.start_button.hide()
         self.stop_button.show()
-        self.data_buttons_frame.setEnabled(False)
-        self.arduino_request('START')
-
-        if self.arduino_response() == "STAOK":
+        # saving works on a snapshot of the data, only resetting it is not possible while streaming
+        self.reset_button.setEnabled(False)
+        self.streaming = True
+        # every device fills its own columns from the end of the data; the batches are taken from the first
+        # poll on (even before STAOK gets here), none is left from an earlier run
+        self.stream_row0 = len(self.data)
+        self.stream_time0 = self.data.last("time")
+        self.stream_offsets = [0] * self.n_devices
+        self.stream_last_seq = [-1] * self.n_devices
+        self.stream_start_stamps = [None] * self.n_devices
+        self.acquisition.drain()
+        self.reset_window_heatmap()  # its bins depend on the sampling rate
+        self.arduino_command('START', self.streaming_started)
+        # the polls follow START on the wire, the device queues are drained from the first sample without
+        # waiting for the reply to get to the GUI thread; the batches are taken once the timer runs
+        self.acquisition.start_polling(self.sampling_rate, self.poll_max_interval)
+
+
+    def streaming_started(self, reply):
+        if not self.streaming:
+            return  # stopped before the devices answered, STOP follows START on the wire
+        if reply == "STAOK":
+            # the devices are aligned on the time their STAOK arrived
+            self.stream_offsets = self.acquisition.start_offsets(self.sampling_rate)
             self.timer.start(self.plotting_rate)
+            self.render_timer.start(int(1000 / self.max_fps))
+            if self.adaptive_quality:
+                self.linear_plot.set_live(True)
+                self.map_plot.set_live(True)
         else:
-            self.serial_monitor_textedit.appendPlainText("Not started ")
+            # what was polled meanwhile is not a run of this START
+            self.acquisition.stop_polling()
+            self.acquisition.drain()
+            self.monitor.warning("Not started ")
 
 
-    def stop_streaming(self):
+    def stop_streaming(self, then=None):
+        # then() is called once the devices answered STOP (or failed to)
         self.start_button.show()
         self.stop_button.hide()
-        self.data_buttons_frame.setEnabled(True)
-        self.arduino_request('STOP')
-
-        if self.arduino_response() == "STOOK":
-            self.timer.stop()
+        self.reset_button.setEnabled(True)
+        self.streaming = False
+        if self.acquisition is None:
+            # the port is closed already, there is no device left to stop
+            self.end_streaming()
+            if then is not None:
+                then()
+            return
+        self.acquisition.stop_polling()
+        self.arduino_command('STOP', lambda reply: self.streaming_stopped(reply, then))
+
+
+    def streaming_stopped(self, reply, then=None):
+        # a device whose port failed is not sampling anymore, STOP can not be answered
+        if reply == "STOOK" or (self.acquisition is not None and self.acquisition.failed):
+            self.end_streaming()
         else:
-            self.serial_monitor_textedit.appendPlainText("Not stopped ")
+            self.monitor.warning("Not stopped ")
+        if then is not None:
+            then()
+
+
+    def end_streaming(self):
+        self.timer.stop()
+        self.render_timer.stop()
+        # the batches polled before STOP was answered are the last of this run, none is left for the next one
+        if self.acquisition is not None and self.update_data():
+            self.render_pending = True
+        self.render_frame(wait=True)
+        # the last frame is drawn again at full quality
+        self.linear_plot.set_live(False)
+        self.map_plot.set_live(False)
 
 
     def timer_isr(self):
         if self.update_data():
+            self.render_pending = True
+
+
+    def render_frame(self, wait=False):
+        # while a render thread draws a frame the plots are left as they are, the next tick renders everything
+        # ingested meanwhile
+        if not wait and (self.linear_plot.busy or self.map_plot.busy):
+            return
+        if self.render_pending:
+            self.render_pending = False
             self.render_data()
 
 
     def update_data(self):
-        self.arduino_request('GET')
-        res = self.arduino_response()
-        if res == "BE":
-            self.stop_streaming()
+        # ingest the batches collected by the acquisition thread since the last tick
+        batches = self.acquisition.drain() if self.acquisition is not None else []
+        results = [self.ingest_measurements(*batch) for batch in batches]
+        if not results:
+            return 0
+        return -1 if -1 in results else 1
+
+
+    def acquisition_stopped(self, status):
+        if self.update_data():
+            self.render_pending = True
+        self.render_frame(wait=True)
+        self.stop_streaming()
+
+        if status == BUFFER_EMPTY:
             msgBox = QMessageBox()
             msgBox.setText("DONE!")
             msgBox.setWindowTitle("")
             msgBox.setStandardButtons(QMessageBox.Ok)
             msgBox.exec_()
-            return 2
 
-        elif res == "BF":
-            self.stop_streaming()
+        elif status == BUFFER_FULL:
             msgBox = QMessageBox()
             msgBox.setIcon(QMessageBox.Warning)
             msgBox.setText("STREAMING STOPPED: BUffer limit reached, try to change streaming parameters.")
             msgBox.setWindowTitle("")
             msgBox.setStandardButtons(QMessageBox.Ok)
             msgBox.exec_()
-            self.stop_streaming()
-            return 0
 
-        elif res:
-            try:
-                res = json.loads(res)
-                res["time"] = self.data["time"].iloc[-1] + self.sampling_rate
-                self.data = self.data.append(
-                    res,
-                    ignore_index=True,
-                )
-                return 1
-
-            except ValueError:
-                res = {
-                    "time": self.data["time"].iloc[-1] + self.sampling_rate,
-                    "T1": -1,
-                    "T2": -1,
-                    "T3": -1,
-                    "T4": -1,
-                    "T5": -1,
-                    "T6": -1,
-                }
-                self.data = self.data.append(
-                    res,
-                    ignore_index=True,
-                )
-                self.serial_monitor_textedit.appendPlainText("failed data!, filled with -1 ")
-                return -1
+        elif status == PORT_FAILED:
+            msgBox = QMessageBox()
+            msgBox.setIcon(QMessageBox.Warning)
+            msgBox.setText("STREAMING STOPPED: connection with the device lost, check the cable and reconnect.")
+            msgBox.setWindowTitle("")
+            msgBox.setStandardButtons(QMessageBox.Ok)
+            msgBox.exec_()
 
-            except Exception as e:
-                self.serial_monitor_textedit.appendPlainText(str(e))
-                return 0
-        else:
-            return 0
+
+    def ingest_measurements(self, device, values, failed):
+        # values columns: sequence number since START, device time stamp (ms) and the six channels.
+        # Samples are placed by sequence number and timed by their stamps, so batching, delays or
+        # reordering do not shift the timeline, and lost samples leave NaN rows
+        if not len(values):
+            return 1 if not failed else -1
+        last_seq = self.stream_last_seq[device]
+        half = SEQUENCE_MODULO // 2
+        seq = last_seq + (values[:, 0] - last_seq + half) % SEQUENCE_MODULO - half
+
+        if self.stream_start_stamps[device] is None:
+            # the device measures one sampling period after START and every period from there
+            self.stream_start_stamps[device] = values[0, 1] - self.sampling_rate * (seq[0] + 1)
+        elapsed = (values[:, 1] - self.stream_start_stamps[device]) % STAMP_MODULO
+
+        offset = self.stream_offsets[device]
+        times = self.stream_time0 + self.sampling_rate * offset + elapsed
+        rows = (self.stream_row0 + offset + seq).astype(int)
+        self.data.put(rows, self.data.columns[1 + 6 * device: 7 + 6 * device], values[:, 2:])
+        # a single time column: rows are timed by the first device, the others only time the rows it has not
+        # sent (yet), so their clocks do not overwrite each other
+        if device:
+            untimed = isnan(self.data["time"][rows])
+            rows, times = rows[untimed], times[untimed]
+        self.data.put(rows, ["time"], times[:, None])
+        self.pyramid.invalidate(self.stream_row0 + offset + int(seq.min()))
+        self.heatmap.invalidate(self.stream_row0 + offset + int(seq.min()))
+        self.window_heatmap.invalidate(self.stream_row0 + offset + int(seq.min()))
+
+        self.stream_last_seq[device] = max(last_seq, int(seq.max()))
+        missing = self.stream_last_seq[device] - last_seq - int((seq > last_seq).sum())
+        if missing > failed:
+            # not only the measurements reported as failed are missing
+            self.monitor.warning(
+                "gap!, " + str(missing) + " measurements missing before sample "
+                + str(self.stream_last_seq[device]) + (" of device " + str(device + 1) if self.n_devices > 1 else "")
+            )
+
+        if failed or missing > 0:
+            if failed:
+                self.monitor.warning("failed data!, " + str(failed) + " measurements lost ")
+            return -1
+        return 1
 
 
     def render_data(self):
@@ -555,104 +829,234 @@ class MS_interface(QtWidgets.QMainWindow):
             0 - self.inital_data_size * self.sampling_rate,
             0 + self.sampling_rate, self.sampling_rate)
         # initialize data with zeros
-        data = dict(zip(["T1", "T2", "T3", "T4", "T5", "T6"], zeros((6, len(times)))))
-        data["time"] = times
-
-        self.data = DataFrame(
-            data,
-            columns=["time", "T1", "T2", "T3", "T4", "T5", "T6"]
-        )
-        self.update_table_data()
+        channels = channel_names(self.n_devices)
+        self.data = SampleStore(["time"] + channels)
+        self.data.extend(column_stack([times, zeros((len(times), len(channels)))]))
+        self.pyramid.clear()
+        self.heatmap.clear()
+        self.window_heatmap.clear()
+        # the model follows the store from now on, only a new store needs a new model
+        self.table_model = SampleStoreModel(self.data)
+        self.data_table_viewer.setModel(self.table_model)
 
 
     def update_table_data(self):
-        self.data_table_viewer.setModel(PandasModel(self.data))
+        if self.table_model.refresh() and self.follow_tail_checkbox.isChecked():
+            self.table_model.fetch_until(len(self.data) - 1)
+            self.data_table_viewer.scrollToBottom()
+
+
+    def jump_to_time(self):
+        # rows are paged in lazily, the ones up to the target are fetched first
+        row = self.table_model.row_at_time(self.jump_time_spinbox.value())
+        self.follow_tail_checkbox.setChecked(False)
+        self.table_model.fetch_until(row)
+        self.data_table_viewer.scrollTo(
+            self.table_model.index(row, 0), QtWidgets.QAbstractItemView.PositionAtTop
+        )
+        self.data_table_viewer.selectRow(row)
 
 
     def reset_plot_data(self):
+        # artists of a previous number of devices
+        if self._linear_plot_refs is not None:
+            for line in self._linear_plot_refs.values():
+                line.remove()
+            self._cbar.remove()
+            self._map_plot_ref.remove()
+        self.linear_plot.clear_animated()
+        self.map_plot.clear_animated()
+
         self._linear_plot_refs = dict()
         for key in self.data.columns[1:]:
-            self._linear_plot_refs[key] = self.linear_plot.canvas.axes.plot(
+            self._linear_plot_refs[key] = self.linear_plot.axes.plot(
                 self.data["time"],
                 self.data[key],
                 label=key,
-                **linear_plots_styles[key],
+                **linear_plot_style(key),
             )[0]
-        self.linear_plot.canvas.axes.set_title("\nTemperatures - Time Series\n")
-        self.linear_plot.canvas.axes.set_xlabel("t [ms]")
-        self.linear_plot.canvas.axes.set_ylabel("T [°C]")
-        self.linear_plot.canvas.axes.legend(bbox_to_anchor=(0,0,1,1), borderpad=.5, ncols=3)
-
-        self._map_plot_ref = self.map_plot.canvas.axes.imshow(
-            self.data[self.data.columns[1:]].T,
+            self.linear_plot.add_animated(self._linear_plot_refs[key])
+        self.linear_plot.axes.set_title("\nTemperatures - Time Series\n")
+        self.linear_plot.axes.set_xlabel("t [ms]")
+        self.linear_plot.axes.set_ylabel("T [°C]")
+        legend = self.linear_plot.axes.legend(bbox_to_anchor=(0,0,1,1), borderpad=.5, ncols=3)
+        self.linear_plot.add_animated(legend)  # blitted after the lines, so it stays on top
+
+        self.map_heatmap().update(self.data.channels)
+        self._map_plot_ref = self.map_plot.axes.imshow(
+            self.map_heatmap().image(),
             aspect="auto",
             cmap='inferno',
             origin="lower",
             vmin=0,
-            vmax=self.data[self.data.columns[1:]].max().max(),
+            vmax=self.data.extrema(self.data.columns[1:])[1],
         )
+        self.map_plot.add_animated(self._map_plot_ref)
+        # the limits are set by rescale_lims, not by the growing image extent
+        self.map_plot.axes.set_autoscale_on(False)
+
+        # a colorbar only follows the limits of the image it was made for
+        self._cbar = self.map_plot.figure.colorbar(
+                self._map_plot_ref,
+                ax=self.map_plot.axes,
+                pad=0.01,
+                fraction=0.048,
+            )
 
-        if self._cbar is None:
-            self._cbar = self.map_plot.canvas.figure.colorbar(
-                    self._map_plot_ref,
-                    ax=self.map_plot.canvas.axes,
-                    pad=0.01,
-                    fraction=0.048,
-                )
-
-        self.map_plot.canvas.axes.set_yticks(range(0, 6), self.data.columns[1:])
-        self.map_plot.canvas.axes.set_title("\nMap of temperatures - Time Series\n")
-        self.map_plot.canvas.axes.set_xlabel("t [ms]")
-        self.map_plot.canvas.axes.set_ylabel("Thermocouples")
-
-        self.rescale_lims(cbar=False)
-
-
-    def update_plots_data(self):
-        for key in self.data.columns[1:]:
-            self._linear_plot_refs[key].set_xdata(self.data["time"])
-            self._linear_plot_refs[key].set_ydata(self.data[key])
-
-        self._map_plot_ref.set_data(self.data[self.data.columns[1:]].T)
-
-        self.rescale_lims()
-        self.linear_plot.canvas.draw()
-        self.map_plot.canvas.draw()
-
-
-    def rescale_lims(self, cbar=True):
-        self.linear_plot.canvas.axes.dataLim.y1 = self.data[self.data.columns[1:]].max().max() + 30
-        self.linear_plot.canvas.axes.dataLim.y0 = self.data[self.data.columns[1:]].min().min() - 5
-        self.linear_plot.canvas.axes.dataLim.x0 = self.data["time"].iloc[0]
-        self.linear_plot.canvas.axes.dataLim.x1 = self.data["time"].iloc[-1]
-
-        self.linear_plot.canvas.axes.autoscale_view()
-
-        self._map_plot_ref.set_extent(
-            [
-                self.data["time"].iloc[0],
-                self.data["time"].iloc[-1], 
-                0,
-                6,
-            ]
-        )
+        self.map_plot.axes.set_yticks(range(0, len(self.data.columns) - 1), self.data.columns[1:])
+        self.map_plot.axes.set_title("\nMap of temperatures - Time Series\n")
+        self.map_plot.axes.set_xlabel("t [ms]")
+        self.map_plot.axes.set_ylabel("Thermocouples")
+
+        self.rescale_lims(cbar=False, reset_view=True)
+
+
+    def reset_window_heatmap(self):
+        # bins of the ring sized so it holds the samples of the window and of the headroom
+        samples = self.follow_window_spinbox.value() * 1000 * (1 + self.plot_headroom) / self.sampling_rate
+        self.window_heatmap = HeatmapRing(self.map_width, binned=False, bin_size=int(ceil(samples / self.map_width)))
+
+
+    def set_plot_view(self):
+        self.reset_window_heatmap()
+        self.update_plots_data(reset_view=True)
+
+
+    def map_heatmap(self):
+        return self.window_heatmap if self.follow_plot_checkbox.isChecked() else self.heatmap
+
+
+    def update_plots_data(self, reset_view=False):
+        # with threaded rendering, the figures are changed once the frames being drawn are done
+        with self.linear_plot.holding(), self.map_plot.holding():
+            self.map_heatmap().update(self.data.channels)
+            self._map_plot_ref.set_data(self.map_heatmap().image())
+
+            # the static parts (grid, ticks, labels, colorbar) are redrawn only when the limits change,
+            # otherwise only the lines, legend and image are blitted over the cached background
+            linear_changed, map_changed = self.rescale_lims(reset_view=reset_view)
+            self.decimate_lines()
+            self.linear_plot.redraw(full=linear_changed)
+            self.map_plot.redraw(full=map_changed)
+
+
+    def visible_samples(self):
+        # first and stop sample inside the time limits of the linear plot
+        x0, x1 = self.linear_plot.axes.get_xlim()
+        times = self.data["time"]
+        if x0 <= times[0] and x1 >= times[-1]:
+            return 0, len(self.data)
+        if self.follow_plot_checkbox.isChecked() and x1 >= times[-1]:
+            # counted back from the last sample, so following costs the same whatever the session length
+            return max(len(self.data) - 2 - int((times[-1] - x0) / self.sampling_rate), 0), len(self.data)
+        # through the running maximum of the time (lost samples are NaN)
+        times = fmax.accumulate(times)
+        start = max(int(searchsorted(times, x0, side="left")) - 1, 0)
+        return start, int(searchsorted(times, x1, side="right")) + 1
+
+
+    def decimate_lines(self, n_pixels=None):
+        start, stop = self.visible_samples()
+        n_pixels = n_pixels or self.linear_plot.axes_width()
+
+        indexes = self.pyramid.indexes(self.data.channels, start, stop, n_pixels)
+        time = self.data["time"]
+        for channel, key in enumerate(self.data.columns[1:]):
+            self._linear_plot_refs[key].set_data(time[indexes[channel]], self.data[key][indexes[channel]])
+
+
+    def view_moved(self, axes):
+        # whether the user panned or zoomed the axes since rescale_lims last set their limits
+        return (axes.get_xlim(), axes.get_ylim()) != self.view_limits.get(axes)
+
+
+    def rescale_lims(self, cbar=True, reset_view=False):
+        # returns whether the limits of the linear and of the map plot changed. A view panned or zoomed by the
+        # user is left where it is, reset_view (home) makes it follow the data again
+        t0, t1 = self.data["time"][0], self.data["time"][-1]
+        linear_axes = self.linear_plot.axes
+        follow_linear = reset_view or not self.view_moved(linear_axes)
+        linear_changed = follow_linear and self.rescale_xlim(linear_axes, t0, t1, reset_view)
+
+        # extrema of the whole session are tracked by the store, the ones of a window by the pyramid;
+        # the limits move in steps of 10 °C
+        if self.follow_plot_checkbox.isChecked():
+            lows, highs = self.pyramid.extrema(self.data.channels, *self.visible_samples())
+            low, high = fmin.reduce(lows), fmax.reduce(highs)
+        if not self.follow_plot_checkbox.isChecked() or not low <= high:
+            low, high = self.data.extrema(self.data.columns[1:])
+        y0 = floor((low - 5) / 10) * 10
+        y1 = ceil((high + 30) / 10) * 10
+        if follow_linear:
+            if linear_axes.get_ylim() != (y0, y1):
+                linear_axes.set_ylim(y0, y1)
+                linear_changed = True
+            self.view_limits[linear_axes] = linear_axes.get_xlim(), linear_axes.get_ylim()
+
+        # the map columns are bins of samples, the image spans from its first bin to the end of the last one
+        first, stop = self.map_heatmap().first_sample, self.map_heatmap().stop_sample
+        m0 = self.sample_time(first)
+        m1 = m0 + (t1 - m0) * (stop - first) / max(len(self.data) - 1 - first, 1)
+        self._map_plot_ref.set_extent([m0, m1, 0, len(self.data.columns) - 1])
+        map_axes = self.map_plot.axes
+        map_changed = False
+        if reset_view or not self.view_moved(map_axes):
+            map_changed = self.rescale_xlim(map_axes, m0, m1, reset_view)
+            if map_changed:
+                map_axes.set_ylim(0, len(self.data.columns) - 1)
+            self.view_limits[map_axes] = map_axes.get_xlim(), map_axes.get_ylim()
 
         if cbar:
-            self._cbar.mappable.set_clim(vmin=0,vmax=self.data[self.data.columns[1:]].max().max())
+            vmax = ceil(high / 10) * 10
+            if self._cbar.mappable.get_clim() != (0, vmax):
+                self._cbar.mappable.set_clim(vmin=0, vmax=vmax)
+                map_changed = True
+        return linear_changed, map_changed
+
+
+    def rescale_xlim(self, axes, t0, t1, reset_view=False):
+        # the time limits leave room at the right and only move when the last sample gets there; they span
+        # the follow window or the whole session. Called only for a view the user has not moved (or to reset
+        # it). Returns whether they changed
+        x0, x1 = axes.get_xlim()
+        if self.follow_plot_checkbox.isChecked():
+            window = self.follow_window_spinbox.value() * 1000
+            if reset_view or x1 < t1 or abs(x1 - x0 - (1 + self.plot_headroom) * window) > 1e-6 * window:
+                axes.set_xlim(t1 - window, t1 + self.plot_headroom * window)
+                return True
+            return False
+        if reset_view or x0 != t0 or x1 < t1:
+            axes.set_xlim(t0, t1 + self.plot_headroom * (t1 - t0))
+            return True
+        return False
+
+
+    def sample_time(self, index):
+        # time of a sample, or of the last sample before it if it was lost
+        time = self.data["time"][index]
+        return time if time == time else fmax.reduce(self.data["time"][:index + 1])
 
 
     def reset(self):
-        self.serial_monitor_textedit.clear()
-        if self.timer.isActive():
-            self.stop_streaming()
-        if self.serial_port.is_open:
-            self.arduino_request("CLEAR")
-            _=self.arduino_response()
+        self.monitor.clear()
+        if self.streaming:
+            # the data is cleared once the devices stopped, no more batches come after
+            self.stop_streaming(then=self.clear_data)
+        else:
+            self.clear_data()
+
+
+    def clear_data(self):
+        if self.acquisition is not None:
+            self.arduino_command("CLEAR")
         self.reset_table_data()
-        self.update_plots_data()
+        self.update_plots_data(reset_view=True)
 
 
     def save(self):
+        # the files are written by worker processes from a snapshot, streaming goes on meanwhile
+        if self.save_job is not None:
+            return
         try:
             self.output_path = Path(
                 resource_path(
@@ -663,26 +1067,73 @@ class MS_interface(QtWidgets.QMainWindow):
             path_timestamp = time_stamp.strftime("_%Y-%m-%d_%H%M%S")
             base_file_name = self.files_prefix + "_{}" + path_timestamp + ".{}"
 
-            # saving data
             data_file_name = self.output_path / base_file_name.format("data", "xlsx")
-            self.write_data_file(data_file_name, time_stamp)
-
-            #saving plots
-            self.linear_plot.canvas.axes.figure.savefig(
-                self.output_path / base_file_name.format("linear-plot", "png"),
-                dpi=500
-            )
-            self.map_plot.canvas.axes.figure.savefig(
-                self.output_path / base_file_name.format("map-plot", "png"),
-                dpi=500
-            )
-            saved=True
+            header = [
+                ["Temperature Measurement System - results"],
+                ["User name:", self.user_name],
+                ["User role:", self.user_role],
+                ["User email:", self.user_email],
+                ["Date:", time_stamp.ctime()]
+            ]
+            linear_figure, map_figure = self.plot_snapshots(self.export_dpi)
+            tasks = [
+                (data_file_name, write_data_file, (data_file_name, self.data.to_dataframe().copy(), header)),
+            ]
+            for name, figure in (("linear-plot", linear_figure), ("map-plot", map_figure)):
+                file_name = self.output_path / base_file_name.format(name, "png")
+                tasks.append((file_name, save_figure, (file_name, figure, figure_configs, self.export_dpi)))
+
+            self.save_job = ExportJob(tasks, parent=self)
+            self.save_job.progress.connect(self.save_progressed)
+            self.save_job.finished.connect(self.save_finished)
+            self.save_progress = QtWidgets.QProgressDialog("Saving results...", "Cancel", 0, len(tasks), self)
+            self.save_progress.setWindowTitle("")
+            self.save_progress.setWindowModality(QtCore.Qt.NonModal)
+            self.save_progress.setMinimumDuration(0)
+            self.save_progress.canceled.connect(self.save_job.cancel)
+            self.save_button.setEnabled(False)
+            self.save_job.start()
+            self.save_progress.setValue(0)
 
         except Exception as e:
-            error = e
-            saved=False
-        
-        if saved:
+            self.save_job = None
+            self.save_button.setEnabled(True)
+            msgBox = QMessageBox()
+            msgBox.setIcon(QMessageBox.Warning)
+            msgBox.setText("It was not possible to save the results: \n" + str(e))
+            msgBox.setWindowTitle("")
+            msgBox.setStandardButtons(QMessageBox.Ok)
+            msgBox.exec_()
+
+
+    def plot_snapshots(self, dpi):
+        # the figures pickled as they are exported, the lines decimated for the width of the saved image
+        with self.linear_plot.holding(), self.map_plot.holding():
+            axes = self.linear_plot.axes
+            self.decimate_lines(axes.get_position().width * axes.figure.get_figwidth() * dpi)
+            try:
+                return self.linear_plot.snapshot(), self.map_plot.snapshot()
+            finally:
+                self.decimate_lines()
+
+
+    def save_progressed(self, done, file_name):
+        if self.save_progress is not None:
+            self.save_progress.setLabelText("Saved " + Path(file_name).name)
+            self.save_progress.setValue(done)
+
+
+    def save_finished(self, errors):
+        cancelled = self.save_job.cancelled
+        self.save_job = None
+        self.save_progress.reset()  # hides it, closing it would emit canceled
+        self.save_progress = None
+        self.save_button.setEnabled(True)
+        if cancelled:
+            self.monitor.info("Saving cancelled, no file was kept")
+            return
+
+        if not errors:
             msgBox = QMessageBox()
             msgBox.setIcon(QMessageBox.Information)
             msgBox.setText("Graphs and data sucessfully saved in: \n" + str(self.output_path))
@@ -692,32 +1143,16 @@ class MS_interface(QtWidgets.QMainWindow):
         else:
             msgBox = QMessageBox()
             msgBox.setIcon(QMessageBox.Warning)
-            msgBox.setText("It was not possible to save the results: \n" + str(error))
+            msgBox.setText("It was not possible to save the results: \n" + "\n".join(
+                Path(file_name).name + ": " + error for file_name, error in errors.items()
+            ))
             msgBox.setWindowTitle("")
             msgBox.setStandardButtons(QMessageBox.Ok)
             msgBox.exec_()
 
 
-    def write_data_file(self, filename, timestamp):
-        with ExcelWriter(filename, mode='w', engine='openpyxl') as writer:
-            self.data.to_excel(writer, index=False, startrow=7)
-            worksheet = writer.sheets['Sheet1']
-            header = [
-                ["Temperature Measurement System - results"],
-                ["User name:", self.user_name],
-                ["User role:", self.user_role],
-                ["User email:", self.user_email],
-                ["Date:", timestamp.ctime()]
-            ]
-            for i, row in enumerate(header):
-                for j, value in enumerate(row):
-                    cell = worksheet.cell(row=i+1, column=j+1, value=value)
-                    if i == 0:
-                        cell.font = Font(bold=True, size=14)
-
-
     def apply_streaming_params(self):
-        if not self.serial_port.is_open:
+        if self.acquisition is None:
             msgBox = QMessageBox()
             msgBox.setIcon(QMessageBox.Warning)
             msgBox.setText("Not applied: changes will take place when connect serial communication\n")
@@ -727,56 +1162,64 @@ class MS_interface(QtWidgets.QMainWindow):
 
         else:
             self.plotting_rate = self.params_to_apply.get("plotting_rate", self.plotting_rate)
-            changed = [0, 1, 0, 0]
-
-            # setting up arduino parameters
-            self.arduino_request("SETS " + str(self.params_to_apply.get("sampling_rate", self.sampling_rate)))
-            res = self.arduino_response()
-            while res != "SSOK" and res != "SSNOK":
-                self.arduino_request("SETS " + str(self.params_to_apply.get("sampling_rate", self.sampling_rate)))
-                res = self.arduino_response()
-            if res == "SSOK":
-                self.sampling_rate = self.params_to_apply.get("sampling_rate")
-                changed[0] = 1
-
-            self.arduino_request("SETA " + str(self.params_to_apply.get("analysis_time", self.analysis_time)))
-            res = self.arduino_response()
-            while res != "SAOK" and res != "SANOK":
-                self.arduino_request("SETA " + str(self.params_to_apply.get("analysis_time", self.analysis_time)))
-                res = self.arduino_response()
-            if res == "SAOK":
-                self.analysis_time = self.params_to_apply.get("analysis_time", self.analysis_time)
-                changed[2] = 1
-
-            self.arduino_request("BSIZE " + str(self.params_to_apply.get("buffer_size", self.buffer_size)))
-            res = self.arduino_response()
-            while res != "BSOK" and res != "BSNOK":
-                self.arduino_request("BSIZE " + str(self.params_to_apply.get("buffer_size", self.buffer_size)))
-                res = self.arduino_response()
-            if res == "BSOK":
-                self.buffer_size = self.params_to_apply.get("buffer_size")
-                changed[3] = 1
-            
-            self.streaming_params_button.setToolTip(
-                "Sampling rate: " + str(self.sampling_rate) + 
-                "\nPlotting rate: " + str(self.plotting_rate) + 
-                "\nAnalysis time: " + str(self.analysis_time) +
-                "\nBuffer size: " + str(self.buffer_size)
+            requested = {
+                "sampling_rate": self.params_to_apply.get("sampling_rate", self.sampling_rate),
+                "analysis_time": self.params_to_apply.get("analysis_time", self.analysis_time),
+                "buffer_size": self.params_to_apply.get("buffer_size", self.buffer_size),
+            }
+            commands = {
+                "sampling_rate": "SETS " + str(requested["sampling_rate"]),
+                "analysis_time": "SETA " + str(requested["analysis_time"]),
+                "buffer_size": "BSIZE " + str(requested["buffer_size"]),
+            }
+
+            # setting up arduino parameters, the three commands are in flight at once
+            self.arduino_pipeline(
+                list(commands.values()),
+                lambda result: self.streaming_params_applied(requested, commands, result),
             )
 
-            if not all(changed):
-                msgBox = QMessageBox()
-                msgBox.setIcon(QMessageBox.Warning)
-                not_changed_values = ""
-                for i, param in enumerate(self.params_to_apply.keys()):
-                    if not changed[i]:
-                        not_changed_values += param + "\n"
-                msgBox.setText("It was not possible to change the following parameters: \n" + not_changed_values)
-                msgBox.setWindowTitle("")
-                msgBox.setStandardButtons(QMessageBox.Ok)
-                msgBox.exec_()
+
+    def streaming_params_applied(self, requested, commands, result):
+        if result.accepted(commands["sampling_rate"]):
+            self.sampling_rate = requested["sampling_rate"]
+        if result.accepted(commands["analysis_time"]):
+            self.analysis_time = requested["analysis_time"]
+        if result.accepted(commands["buffer_size"]):
+            self.buffer_size = requested["buffer_size"]
+        not_changed = [param for param, command in commands.items() if not result.accepted(command)]
+
+        self.streaming_params_button.setToolTip(
+            "Sampling rate: " + str(self.sampling_rate) + 
+            "\nPlotting rate: " + str(self.plotting_rate) + 
+            "\nAnalysis time: " + str(self.analysis_time) +
+            "\nBuffer size: " + str(self.buffer_size)
+        )
+
+        if not_changed:
+            msgBox = QMessageBox()
+            msgBox.setIcon(QMessageBox.Warning)
+            not_changed_values = ""
+            for param in not_changed:
+                not_changed_values += param + "\n"
+            if result.unanswered:
+                not_changed_values += "\n(no response to " + ", ".join(result.unanswered) + ")\n"
+            msgBox.setText("It was not possible to change the following parameters: \n" + not_changed_values)
+            msgBox.setWindowTitle("")
+            msgBox.setStandardButtons(QMessageBox.Ok)
+            msgBox.exec_()
+
+    def closeEvent(self, event):
+        if self.save_job is not None:
+            self.save_job.wait()  # the files being saved are completed
+        self.stop_acquisition()
+        self.monitor.close()
+        self.linear_plot.set_threaded(False)
+        self.map_plot.set_threaded(False)
+        super(MS_interface, self).closeEvent(event)
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # the save workers of a frozen executable
     QtWidgets.QApplication.setAttribute(QtCore.Qt.AA_EnableHighDpiScaling)
     app = QtWidgets.QApplication(sys.argv)
     ui = MS_interface()
@@ -1,9 +1,20 @@
 
+import pickle
+import queue
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from logging import DEBUG, WARNING
+
 import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import RendererAgg
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
 from PyQt5.QtWidgets import QVBoxLayout, QWidget
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QThread, pyqtSignal
+from PyQt5.QtGui import QImage, QPainter, QResizeEvent
+from qtplot import QtPlotView
 
 
 figure_configs = {
@@ -73,8 +84,417 @@ linear_plots_styles = {
 }
 
 
+# extra devices reuse the thermocouple colors and markers with other line styles
+devices_linestyles = ["--", ":", "-.", "-"]
+
+
+def linear_plot_style(column):
+	"""style of a "T1" column or of a "D2-T1" column when several devices are plotted"""
+	device, _, channel = column.rpartition("-")
+	style = dict(linear_plots_styles[channel])
+	if device:
+		style["linestyle"] = devices_linestyles[(int(device[1:]) - 1) % len(devices_linestyles)]
+	return style
+
+
+class BlitManager:
+	"""Redraws only the animated artists of a canvas over a cached background.
+
+	Artists added with add_artist() are excluded from regular draws; every
+	full draw (canvas.draw(), resizes) caches the rest of the figure and
+	update() restores that background and blits the animated artists only.
+	"""
+	def __init__(self, canvas):
+		self.canvas = canvas
+		self._artists = []
+		self._background = None
+		self.canvas.animated = self._artists  # drawn by the render thread of a threaded canvas
+		self.canvas.mpl_connect("draw_event", self._on_draw)
+
+	def add_artist(self, artist):
+		artist.set_animated(True)
+		self._artists.append(artist)
+
+	def clear(self):
+		del self._artists[:]
+
+	def _on_draw(self, event):
+		if self.canvas.threaded:
+			return  # the render thread keeps its own background
+		self._background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+		self._draw_animated()
+
+	def _draw_animated(self):
+		for artist in self._artists:
+			self.canvas.figure.draw_artist(artist)
+
+	def update(self):
+		if self.canvas.threaded:
+			self.canvas.request_frame(full=False)
+			return
+		if self._background is None:
+			self.canvas.draw()  # caches the background through _on_draw
+			return
+		start = time.perf_counter()
+		self.canvas.restore_region(self._background)
+		self._draw_animated()
+		self.canvas.blit(self.canvas.figure.bbox)
+		self.canvas.frame_rendered.emit(time.perf_counter() - start)
+
+	@contextmanager
+	def exporting(self):
+		"""Animated artists are skipped by savefig, draw them as regular ones meanwhile."""
+		with self.canvas.holding():
+			for artist in self._artists:
+				artist.set_animated(False)
+			try:
+				yield
+			finally:
+				for artist in self._artists:
+					artist.set_animated(True)
+
+
+class RenderThread(QThread):
+	"""Renders frames of a figure on off-screen Agg buffers.
+
+	A frame is either a full draw of the figure, animated artists excluded,
+	kept as the background of the next frames, or the background restored
+	and the animated artists drawn over it. Frames alternate between two
+	renderers and are emitted as a QImage wrapping the renderer buffer, with
+	no copy, together with the renderer that keeps the buffer alive and the
+	time it took; the canvas sends a new frame only once it received the
+	previous one, so the buffer it shows is never drawn on.
+	"""
+	rendered = pyqtSignal(object)
+
+	def __init__(self, figure, log=None, parent=None):
+		super(RenderThread, self).__init__(parent)
+		self.figure = figure
+		# called from this thread, it must be thread-safe (see SerialLog)
+		self.log = log or (lambda message, level=None: None)
+		self.idle = threading.Event()
+		self.idle.set()
+		self._jobs = queue.Queue()
+		self._renderers = [None, None]
+		self._next = 0
+		self._background = None
+
+	def render(self, full, artists):
+		self.idle.clear()
+		self._jobs.put((full, artists))
+
+	def stop(self):
+		self._jobs.put(None)
+		self.wait()
+
+	def run(self):
+		while True:
+			job = self._jobs.get()
+			if job is None:
+				return
+			full, artists = job
+			try:
+				self.rendered.emit(self._render(full, artists))
+			except Exception as e:
+				# the figure may have been changed while it was drawn, the next frame draws it all again
+				self.log("Fail rendered frame: " + (str(e) or type(e).__name__), WARNING)
+				self.log(traceback.format_exc(), DEBUG)
+				self._background = None
+				self.rendered.emit((None, None, 0))
+			self.idle.set()
+
+	def _render(self, full, artists):
+		start = time.perf_counter()
+		width, height = (int(size) for size in self.figure.bbox.size)
+		renderer = self._renderers[self._next]
+		if renderer is None or (renderer.width, renderer.height) != (width, height):
+			renderer = self._renderers[self._next] = RendererAgg(width, height, self.figure.dpi)
+			full = True
+		self._next = 1 - self._next
+		if full or self._background is None:
+			renderer.clear()
+			self.figure.draw(renderer)
+			self._background = renderer.copy_from_bbox(self.figure.bbox)
+		else:
+			renderer.restore_region(self._background)
+		for artist in artists:
+			artist.draw(renderer)
+		image = QImage(renderer.buffer_rgba(), width, height, QImage.Format_RGBA8888)
+		return image, renderer, time.perf_counter() - start
+
+
+class Canvas(FigureCanvas):
+	"""FigureCanvas that can render in a worker thread.
+
+	Once set_threaded(True), draws and blits are requests to a RenderThread
+	and the GUI thread only paints the last frame it emitted, so mouse and
+	toolbar events are handled while heavy frames are drawn. Requests made
+	while a frame is being drawn are merged in a single next frame, full if
+	any of them was. `busy` tells whether a frame is being drawn, the figure
+	should not be changed meanwhile.
+
+	Mouse, key and resize events are handled holding the frames (see
+	holding()): toolbar pan and zoom, resizing and the callbacks of the
+	figure enter and leave events change the figure from the GUI thread.
+
+	The figure is rendered at render_scale times the screen resolution and
+	scaled to the widget when painted. frame_rendered is emitted with the
+	time every draw or blit took. Errors of the render thread go to `log`.
+	"""
+	frame_rendered = pyqtSignal(float)
+
+	def __init__(self, figure):
+		super(Canvas, self).__init__(figure)
+		self.render_scale = 1.0
+		self.threaded = False
+		self.busy = False
+		self.animated = []
+		self.log = lambda message, level=None: None
+		self._render_thread = None
+		self._frame = None
+		self._held = 0  # nesting depth of holding()
+		self._pending = None  # None, or whether the next frame is a full one
+
+	def set_threaded(self, threaded):
+		if threaded == self.threaded:
+			return
+		if threaded:
+			self._render_thread = RenderThread(self.figure, self.log)
+			self._render_thread.rendered.connect(self._show_frame)
+			self._render_thread.start()
+		else:
+			self._render_thread.stop()
+			self._render_thread = None
+			self._frame = None
+			self.busy = False
+		self.threaded = threaded
+		self.draw_idle()
+
+	def draw(self):
+		if self.threaded:
+			self.request_frame(full=True)
+		else:
+			start = time.perf_counter()
+			super(Canvas, self).draw()
+			self.frame_rendered.emit(time.perf_counter() - start)
+
+	def resizeEvent(self, event):
+		# hidden, another renderer shows the figure and sets its size
+		if not self.isHidden():
+			with self.holding():
+				super(Canvas, self).resizeEvent(event)
+
+	def set_render_scale(self, scale):
+		self.render_scale = scale
+		self._update_pixel_ratio()
+
+	def _update_pixel_ratio(self):
+		# the device pixel ratio is how matplotlib sizes the buffer of a canvas for the screen resolution
+		if self._set_device_pixel_ratio((self.devicePixelRatioF() or 1) * self.render_scale):
+			self.resizeEvent(QResizeEvent(self.size(), self.size()))
+
+	def request_frame(self, full):
+		self._pending = full or bool(self._pending)
+		self._send_frame()
+
+	def _send_frame(self):
+		if self.busy or self._held or self._pending is None:
+			return
+		self.busy = True
+		self._render_thread.render(self._pending, list(self.animated))
+		self._pending = None
+
+	def _show_frame(self, frame):
+		if not self.threaded:
+			return
+		self.busy = False
+		if frame[0] is not None:
+			frame[0].setDevicePixelRatio(self.device_pixel_ratio)
+			self._frame = frame
+			self.update()
+			self.frame_rendered.emit(frame[2])
+		self._send_frame()
+
+	@contextmanager
+	def holding(self):
+		"""Wait for the frame being drawn and send no other one meanwhile,
+		so the figure can be changed or exported from the GUI thread."""
+		self._held += 1
+		try:
+			if self.threaded:
+				self._render_thread.idle.wait()
+			yield
+		finally:
+			self._held -= 1
+			if self.threaded and not self.busy and not self._held:
+				self._send_frame()
+
+	def mousePressEvent(self, event):
+		with self.holding():
+			super(Canvas, self).mousePressEvent(event)
+
+	def mouseDoubleClickEvent(self, event):
+		with self.holding():
+			super(Canvas, self).mouseDoubleClickEvent(event)
+
+	def mouseMoveEvent(self, event):
+		if event.buttons() == Qt.NoButton:
+			# hovering only updates the toolbar message
+			super(Canvas, self).mouseMoveEvent(event)
+			return
+		with self.holding():
+			super(Canvas, self).mouseMoveEvent(event)
+
+	def mouseReleaseEvent(self, event):
+		with self.holding():
+			super(Canvas, self).mouseReleaseEvent(event)
+
+	def wheelEvent(self, event):
+		with self.holding():
+			super(Canvas, self).wheelEvent(event)
+
+	def enterEvent(self, event):
+		with self.holding():
+			super(Canvas, self).enterEvent(event)
+
+	def leaveEvent(self, event):
+		with self.holding():
+			super(Canvas, self).leaveEvent(event)
+
+	def keyPressEvent(self, event):
+		with self.holding():
+			super(Canvas, self).keyPressEvent(event)
+
+	def paintEvent(self, event):
+		if not self.threaded:
+			super(Canvas, self).paintEvent(event)
+			return
+		self._draw_idle()  # only does something if a draw is pending
+		if self._frame is None:
+			return
+		painter = QPainter(self)
+		try:
+			painter.eraseRect(event.rect())
+			painter.drawImage(0, 0, self._frame[0])
+			self._draw_rect_callback(painter)
+		finally:
+			painter.end()
+
+
+class QualityGovernor:
+	"""Trades rendering quality for frame time while streaming.
+
+	Live, the figure is drawn without markers and without solving its layout
+	again (the axes keep their last positions), at the render scale of the
+	current level: the smoothed frame time is compared to `target`, a level
+	down when it is above, a level up once it has stayed under half of it
+	for `patience` frames. Leaving live mode or hovering the canvas draws at
+	full quality again.
+	"""
+	scales = (1.0, 0.75, 0.5, 0.35)
+
+	def __init__(self, canvas, target=0.05, smoothing=0.2, patience=20):
+		self.canvas = canvas
+		self.target = target
+		self.smoothing = smoothing
+		self.patience = patience
+		self.level = 0
+		self.live = False
+		self.hovering = False
+		self._frame_time = None
+		self._fast_frames = 0
+		self._settling = 0  # frames not measured after a change
+		self._markers = {}  # line -> marker, while they are hidden
+		self._layout = None  # layout engine, while it is off
+		self.canvas.frame_rendered.connect(self.frame_done)
+		self.canvas.mpl_connect("figure_enter_event", lambda event: self._hover(True))
+		self.canvas.mpl_connect("figure_leave_event", lambda event: self._hover(False))
+
+	@property
+	def reduced(self):
+		return self.live and not self.hovering
+
+	def set_live(self, live):
+		self.live = live
+		self._apply()
+
+	@contextmanager
+	def suspended(self):
+		"""The figure at full quality inside the block, for exports."""
+		figure = self.canvas.figure
+		with self.canvas.holding():
+			for line, marker in self._markers.items():
+				line.set_marker(marker)
+			if self._layout is not None:
+				figure.set_layout_engine(self._layout)
+			try:
+				yield
+			finally:
+				for line in self._markers:
+					line.set_marker("None")
+				if self._layout is not None:
+					figure.set_layout_engine("none")
+
+	def _hover(self, hovering):
+		self.hovering = hovering
+		if self.live:
+			self._apply()
+
+	def frame_done(self, seconds):
+		if not self.reduced:
+			return
+		if self._settling:
+			self._settling -= 1
+			return
+		if self._frame_time is None:
+			self._frame_time = seconds
+		else:
+			self._frame_time += self.smoothing * (seconds - self._frame_time)
+
+		if self._frame_time > self.target and self.level < len(self.scales) - 1:
+			self.level += 1
+			self._apply()
+		elif self._frame_time < self.target / 2 and self.level > 0:
+			self._fast_frames += 1
+			if self._fast_frames >= self.patience:
+				self.level -= 1
+				self._apply()
+		else:
+			self._fast_frames = 0
+
+	def _apply(self):
+		reduced = self.reduced
+		figure = self.canvas.figure
+		with self.canvas.holding():
+			lines = [line for axes in figure.axes for line in axes.get_lines()]
+			if reduced and not self._markers:
+				self._markers = {line: line.get_marker() for line in lines}
+				for line in lines:
+					line.set_marker("None")
+			elif not reduced and self._markers:
+				for line, marker in self._markers.items():
+					line.set_marker(marker)
+				self._markers = {}
+
+			if reduced and self._layout is None and figure.get_layout_engine() is not None:
+				self._layout = figure.get_layout_engine()
+				figure.set_layout_engine("none")
+			elif not reduced and self._layout is not None:
+				figure.set_layout_engine(self._layout)
+				self._layout = None
+
+			self.canvas.set_render_scale(self.scales[self.level] if reduced else 1.0)
+		# the first frames of a new quality include a full draw, they are not measured
+		self._frame_time = None
+		self._fast_frames = 0
+		self._settling = 2
+		self.canvas.draw_idle()
+
+
 # custom toolbar with lorem ipsum text
 class ToolbarWidget(NavigationToolbar):
+	home_requested = pyqtSignal()
+
 	def __init__(self, canvas_, parent_=None):
 		self.toolitems = (
 		('Home', 'Reset original view', 'home', 'home'),
@@ -87,14 +507,33 @@ class ToolbarWidget(NavigationToolbar):
 		)
 		NavigationToolbar.__init__(self, canvas_, parent_)
 
+	def home(self, *args):
+		# the first view of a streaming plot is long gone, the application sets the view to follow the data
+		self.home_requested.emit()
+
 
 class PlotWidget(QWidget):
-	"""docstring for MplWidget"""
+	"""Plot of a matplotlib figure, shown by one of two renderers.
+
+	The figure (figure, axes) is the model of the plot, it is what gets
+	exported and what both renderers show:
+
+	- "matplotlib": the Agg canvas with its toolbar, blitting of the
+	  animated artists, optional render thread and quality governor;
+	- "qt": a QtPlotView painting the figure with QPainter, much cheaper
+	  while streaming, the figure is only drawn by matplotlib for exports.
+
+	The application changes the figure and asks for frames through this
+	widget only (redraw, holding, busy, set_live...), whatever the renderer.
+	"""
+	renderers = ("matplotlib", "qt")
+	home_requested = pyqtSignal()
+
 	def __init__(self, parent = None):
 		super(PlotWidget, self).__init__()
 		
 		self.vertical_layout = QVBoxLayout()
-		self.canvas = FigureCanvas(plt.Figure(dpi=100, facecolor="#fff"))
+		self.canvas = Canvas(plt.Figure(dpi=100, facecolor="#fff"))
 		self.toolbar = ToolbarWidget(self.canvas, parent)
 
 		self.vertical_layout.addWidget(self.canvas, stretch=3)
@@ -104,6 +543,99 @@ class PlotWidget(QWidget):
 		self.vertical_layout.setSpacing(0)
 		self.vertical_layout.setContentsMargins(0, 0, 0, 0)
 
+		self.toolbar.home_requested.connect(self.home_requested)
+
 		self.canvas.axes = self.canvas.figure.add_subplot(111, facecolor="#000")
 		self.canvas.axes.grid(True, color="gray", linewidth=0.5)
+		self.blit = BlitManager(self.canvas)
+		self.quality = QualityGovernor(self.canvas)
+		self.view = None  # QtPlotView, made when the "qt" renderer is first used
+		self.renderer = "matplotlib"
+		self.live = False
 		self.setLayout(self.vertical_layout)
+
+	@property
+	def figure(self):
+		return self.canvas.figure
+
+	@property
+	def axes(self):
+		return self.canvas.axes
+
+	@property
+	def busy(self):
+		# whether a frame is being drawn, the figure should not be changed meanwhile
+		return self.canvas.busy
+
+	def set_renderer(self, renderer):
+		if renderer not in self.renderers:
+			raise ValueError("Unknown plot renderer: {}".format(renderer))
+		if renderer == "qt" and self.view is None:
+			self.view = QtPlotView(self.figure)
+			self.view.home_requested.connect(self.home_requested)
+			self.vertical_layout.insertWidget(0, self.view, stretch=3)
+		self.quality.set_live(False)
+		self.canvas.setVisible(renderer == "matplotlib")
+		self.toolbar.setVisible(renderer == "matplotlib")
+		if self.view is not None:
+			self.view.setVisible(renderer == "qt")
+		self.renderer = renderer
+		self.set_live(self.live)
+		self.redraw(full=True)
+
+	def set_threaded(self, threaded):
+		self.canvas.set_threaded(threaded)
+
+	def set_log(self, log):
+		# where the errors of the render thread are reported
+		self.canvas.log = log
+
+	def set_frame_budget(self, seconds):
+		self.quality.target = seconds
+
+	def set_live(self, live):
+		# only the matplotlib renderer trades quality for frame time
+		self.live = live
+		self.quality.set_live(live and self.renderer == "matplotlib")
+		if not live and self.view is not None:
+			self.view.relayout()
+
+	def add_animated(self, artist):
+		# artists changed on every frame: blitted by the matplotlib renderer
+		self.blit.add_artist(artist)
+
+	def clear_animated(self):
+		self.blit.clear()
+
+	def holding(self):
+		return self.canvas.holding()
+
+	@contextmanager
+	def exporting(self):
+		# the figure as it is exported: animated artists drawn as regular ones, at full quality
+		with self.blit.exporting(), self.quality.suspended():
+			yield
+
+	def snapshot(self):
+		"""The figure pickled as it is exported, to be saved outside of the GUI thread."""
+		with self.exporting():
+			return pickle.dumps(self.figure)
+
+	def redraw(self, full=False):
+		"""Show the changes of the figure; full when more than the animated artists changed."""
+		if self.renderer == "qt":
+			# as with the quality governor, the axes are not laid out again while streaming
+			if full and not self.live:
+				self.view.relayout()
+			else:
+				self.view.update()
+		elif full:
+			self.canvas.draw()
+		else:
+			self.blit.update()
+
+	def axes_width(self):
+		# width of the axes in screen pixels
+		if self.renderer == "qt":
+			return self.view.axes_rect(self.axes).width()
+		return self.axes.bbox.width
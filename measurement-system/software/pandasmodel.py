@@ -1,26 +1,141 @@
-from PyQt5.QtCore import QAbstractTableModel, Qt
+from collections import OrderedDict
 
-class PandasModel(QAbstractTableModel):
+from numpy import fmax, searchsorted
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt
 
-    def __init__(self, data, parent=None):
-        QAbstractTableModel.__init__(self)
-        self._data = data
-        self.rows = data.shape[0]
-        self.columns = data.shape[1]
 
-    def rowCount(self, parent=None):
-        return self.rows
+# printf-style format of the cells of each column, temperatures use default_format
+column_formats = {"time": "%.0f"}
+default_format = "%.2f"
 
-    def columnCount(self, parnet=None):
-        return self.columns
+
+class FormattedBlocks:
+    """Bounded LRU cache of table cells formatted as strings, by blocks of rows.
+
+    A missing block is formatted at once, column by column, from the
+    (columns x rows) array returned by `values()`, so painting a cell is a
+    dictionary and a list lookup. Only max_blocks blocks are kept, the ones
+    around the visible part of the table.
+    """
+
+    def __init__(self, values, formats, block_size=256, max_blocks=64):
+        self._values = values
+        self._formats = formats
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+        self._blocks = OrderedDict()
+
+    def get(self, row, column):
+        key = row // self.block_size
+        block = self._blocks.get(key)
+        if block is None:
+            start = key * self.block_size
+            values = self._values()[:, start:start + self.block_size]
+            block = [[fmt % value for value in col.tolist()] for fmt, col in zip(self._formats, values)]
+            self._blocks[key] = block
+            if len(self._blocks) > self.max_blocks:
+                self._blocks.popitem(last=False)
+        else:
+            self._blocks.move_to_end(key)
+        return block[column][row - key * self.block_size]
+
+    def invalidate(self, first_row=0):
+        """Drop the blocks holding rows from first_row on."""
+        for key in [key for key in self._blocks if (key + 1) * self.block_size > first_row]:
+            del self._blocks[key]
+
+
+def _formats(columns, formats=None):
+    formats = dict(column_formats, **(formats or {}))
+    return [formats.get(name, default_format) for name in columns]
+
+
+class SampleStoreModel(QAbstractTableModel):
+    """Live, lazily paged table model bound to a SampleStore.
+
+    The model only reports the rows the view has fetched: it starts with a
+    page of rows and Qt asks for more pages with canFetchMore/fetchMore as
+    the view is scrolled down, so a long session is not sized up front.
+    refresh(), called once per rendered frame, announces the rows appended to
+    the store since the previous call with a single beginInsertRows/
+    endInsertRows pair if the view had fetched every row (up to a page, the
+    rest is paged in later), and the already shown rows written meanwhile
+    (late or reordered samples) with one dataChanged, so its cost depends
+    only on what changed. Cells are served from a FormattedBlocks cache that
+    drops the blocks refresh() touches.
+    """
+
+    page_size = 1000
+
+    def __init__(self, store, formats=None, parent=None):
+        QAbstractTableModel.__init__(self, parent)
+        self._store = store
+        self._cells = FormattedBlocks(lambda: store.values, _formats(store.columns, formats))
+        self.rows = min(len(store), self.page_size)
+        self._known = len(store)  # rows in the store at the last refresh
+        store.pop_changed()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.rows
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._store.columns)
 
     def data(self, index, role=Qt.DisplayRole):
         if index.isValid():
             if role == Qt.DisplayRole:
-                return str(self._data.iloc[index.row(), index.column()])
+                return self._cells.get(index.row(), index.column())
         return None
 
-    def headerData(self, col, orientation, role):
-        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
-            return self._data.columns[col]
-        return None
\ No newline at end of file
+    def headerData(self, section, orientation, role):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self._store.columns[section]
+        return str(section + 1)  # rows are numbered from 1
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.rows < len(self._store)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not parent.isValid():
+            self._insert(min(self.page_size, len(self._store) - self.rows))
+
+    def fetch_until(self, row):
+        """Fetch every row up to `row` (included)."""
+        self._insert(min(row + 1, len(self._store)) - self.rows)
+
+    def _insert(self, new_rows):
+        if new_rows > 0:
+            self.beginInsertRows(QModelIndex(), self.rows, self.rows + new_rows - 1)
+            self.rows += new_rows
+            self.endInsertRows()
+
+    def row_at_time(self, time):
+        """First row at or after `time`, through the running maximum of the
+        time column (rows of lost samples have a NaN time)."""
+        times = fmax.accumulate(self._store["time"])
+        return min(int(searchsorted(times, time, side="left")), len(self._store) - 1)
+
+    def refresh(self):
+        """Announce the rows changed since the last call; returns the number of new rows."""
+        changed = self._store.pop_changed()
+        if changed is not None:
+            self._cells.invalidate(changed)
+        if len(self._store) < self._known:
+            # the store was cleared
+            self.beginResetModel()
+            self.rows = min(len(self._store), self.page_size)
+            self._known = len(self._store)
+            self.endResetModel()
+            return 0
+        if changed is not None and changed < self.rows:
+            self.dataChanged.emit(
+                self.index(changed, 0), self.index(self.rows - 1, self.columnCount() - 1)
+            )
+
+        new_rows = len(self._store) - self._known
+        if self.rows == self._known:
+            self._insert(min(new_rows, self.page_size))
+        self._known = len(self._store)
+        return max(new_rows, 0)
@@ -0,0 +1,390 @@
+from matplotlib import rcParams
+from matplotlib.colors import to_rgba
+from matplotlib.font_manager import FontProperties
+from numpy import (
+    arange, ascontiguousarray, asarray, clip, column_stack, concatenate, diff, flatnonzero, frombuffer, int8, isfinite,
+    isnan, linspace, uint8
+)
+from PyQt5.QtCore import QPointF, QRectF, Qt, pyqtSignal
+from PyQt5.QtGui import QColor, QFont, QFontMetricsF, QImage, QPainter, QPen, QPolygonF
+from PyQt5.QtWidgets import QSizePolicy, QWidget
+
+
+# matplotlib line styles drawn by Qt pen styles
+pen_styles = {"-": Qt.SolidLine, "--": Qt.DashLine, ":": Qt.DotLine, "-.": Qt.DashDotLine}
+
+
+class QtPlotView(QWidget):
+    """Live view of a matplotlib figure painted with QPainter.
+
+    The figure stays the model of the plot (artists, limits, locators and
+    formatters, what gets exported); this widget only reads it and paints
+    what the plots of this application are made of: axes at the positions
+    of the figure, with their background, grid, ticks, titles and legend,
+    lines as polylines filled from their NumPy data, images as indexed
+    color QImages scaled to their extent and colorbars as a gradient. Line
+    markers are not drawn. Painting does not go through matplotlib's
+    renderer, so a frame costs a few milliseconds whatever the size of the
+    widget.
+
+    Dragging pans the axes under the mouse, the wheel zooms its time axis,
+    a double click asks for the original view through home_requested.
+    """
+    home_requested = pyqtSignal()
+
+    def __init__(self, figure, parent=None):
+        super(QtPlotView, self).__init__(parent)
+        self.figure = figure
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        self.setToolTip("Drag to pan, scroll to zoom the time axis, double click to reset the view")
+        self._drag = None  # axes, mouse position and limits when a drag started
+        self._color_tables = {}  # (colormap name, bad color) -> color table
+        self._layout_pending = True
+
+    @property
+    def dpi(self):
+        # resolution of the figure on this screen, the matplotlib canvas lays it out the same way
+        return self.figure.dpi / self.figure.canvas.device_pixel_ratio
+
+    def resizeEvent(self, event):
+        # the figure keeps the size of the view, as it does with the canvas, so its layout and its exports
+        # stay the same
+        if not self.isHidden():
+            self.figure.set_size_inches(self.width() / self.dpi, self.height() / self.dpi, forward=False)
+            self._layout_pending = True
+        super(QtPlotView, self).resizeEvent(event)
+
+    def relayout(self):
+        """Paint again once the layout engine of the figure placed the axes for their current labels."""
+        self._layout_pending = True
+        self.update()
+
+    def axes_rect(self, axes):
+        box = axes.get_position()
+        return QRectF(box.x0 * self.width(), (1 - box.y1) * self.height(), box.width * self.width(),
+                      box.height * self.height())
+
+    def paintEvent(self, event):
+        if self._layout_pending:
+            # the positions of the axes are only updated by the layout engine, which matplotlib runs on draws
+            self._layout_pending = False
+            if self.figure.get_layout_engine() is not None:
+                self.figure.get_layout_engine().execute(self.figure)
+        painter = QPainter(self)
+        try:
+            painter.fillRect(self.rect(), _color(self.figure.get_facecolor()))
+            for axes in self.figure.axes:
+                if axes.get_visible():
+                    self._paint_axes(painter, axes)
+        finally:
+            painter.end()
+
+    # ------------------------------------------------------------------ painting
+
+    def _paint_axes(self, painter, axes):
+        rect = self.axes_rect(axes)
+        if rect.width() <= 0 or rect.height() <= 0:
+            return
+        x0, x1 = axes.get_xlim()
+        y0, y1 = axes.get_ylim()
+        to_x = _scale(x0, x1, rect.left(), rect.right())
+        to_y = _scale(y0, y1, rect.bottom(), rect.top())
+        colorbar = getattr(axes, "_colorbar", None)
+
+        painter.save()
+        painter.setClipRect(rect)
+        painter.fillRect(rect, _color(axes.get_facecolor()))
+        if colorbar is not None:
+            self._paint_colorbar(painter, colorbar, rect)
+        for image in axes.get_images():
+            if image.get_visible():
+                self._paint_image(painter, image, axes, to_x, to_y)
+        x_ticks = _ticks(axes.xaxis, x0, x1)
+        y_ticks = _ticks(axes.yaxis, y0, y1)
+        self._paint_grid(painter, axes.xaxis, [to_x(value) for value, _ in x_ticks], rect, vertical=True)
+        self._paint_grid(painter, axes.yaxis, [to_y(value) for value, _ in y_ticks], rect, vertical=False)
+        painter.setRenderHint(QPainter.Antialiasing)
+        for line in axes.get_lines():
+            if line.get_visible():
+                self._paint_line(painter, line, to_x, to_y)
+        painter.restore()
+
+        painter.save()
+        for side, spine in axes.spines.items():
+            if spine.get_visible():
+                painter.setPen(QPen(_color(spine.get_edgecolor()), self._pixels(spine.get_linewidth())))
+                if side in ("left", "right", "top", "bottom"):
+                    painter.drawLine(*_side(rect, side))
+                else:
+                    painter.drawRect(rect)  # outline of a colorbar
+        self._paint_ticks(painter, axes, x_ticks, y_ticks, to_x, to_y, rect)
+        legend = axes.get_legend()
+        if legend is not None and legend.get_visible():
+            self._paint_legend(painter, legend, rect)
+        painter.restore()
+
+    def _paint_line(self, painter, line, to_x, to_y):
+        x, y = line.get_data(orig=False)
+        x, y = to_x(asarray(x, dtype=float)), to_y(asarray(y, dtype=float))
+        pen = QPen(_color(line.get_color(), line.get_alpha()), self._pixels(line.get_linewidth()))
+        pen.setStyle(pen_styles.get(line.get_linestyle(), Qt.NoPen))
+        painter.setPen(pen)
+        # lost samples are NaN, they split the line as in matplotlib
+        valid = isfinite(x) & isfinite(y)
+        edges = flatnonzero(diff(concatenate([[0], valid.view(int8), [0]])))
+        for start, stop in edges.reshape(-1, 2):
+            if stop - start > 1:
+                painter.drawPolyline(_polygon(x[start:stop], y[start:stop]))
+
+    def _paint_image(self, painter, image, axes, to_x, to_y):
+        data = asarray(image.get_array(), dtype=float)
+        if data.ndim != 2 or data.size == 0:
+            return
+        norm = image.norm
+        span = norm.vmax - norm.vmin if norm.vmin is not None and norm.vmax is not None else 0
+        indexes = clip((data - norm.vmin) * (254 / span), 0, 254) if span > 0 else data * 0
+        indexes = indexes.astype(uint8)
+        indexes[isnan(data)] = 255
+        if image.origin == "lower":
+            indexes = indexes[::-1]
+        indexes = ascontiguousarray(indexes)
+        height, width = indexes.shape
+        qimage = QImage(indexes.data, width, height, width, QImage.Format_Indexed8)
+        qimage.setColorTable(self._color_table(image.get_cmap(), axes.get_facecolor()))
+        left, right, bottom, top = image.get_extent()
+        target = QRectF(QPointF(to_x(left), to_y(top)), QPointF(to_x(right), to_y(bottom))).normalized()
+        painter.drawImage(target, qimage)
+
+    def _paint_colorbar(self, painter, colorbar, rect):
+        gradient = ascontiguousarray(arange(254, -1, -1, dtype=uint8)[:, None])
+        if colorbar.orientation == "horizontal":
+            gradient = ascontiguousarray(gradient[::-1].T)
+        height, width = gradient.shape
+        qimage = QImage(gradient.data, width, height, width, QImage.Format_Indexed8)
+        qimage.setColorTable(self._color_table(colorbar.cmap, colorbar.ax.get_facecolor()))
+        painter.drawImage(rect, qimage)
+
+    def _paint_grid(self, painter, axis, positions, rect, vertical):
+        ticks = axis.get_major_ticks(1)
+        if not ticks or not ticks[0].gridline.get_visible():
+            return
+        gridline = ticks[0].gridline
+        pen = QPen(_color(gridline.get_color(), gridline.get_alpha()), self._pixels(gridline.get_linewidth()))
+        pen.setStyle(pen_styles.get(gridline.get_linestyle(), Qt.SolidLine))
+        painter.setPen(pen)
+        for position in positions:
+            if vertical:
+                painter.drawLine(QPointF(position, rect.top()), QPointF(position, rect.bottom()))
+            else:
+                painter.drawLine(QPointF(rect.left(), position), QPointF(rect.right(), position))
+
+    def _paint_ticks(self, painter, axes, x_ticks, y_ticks, to_x, to_y, rect):
+        painter.setPen(QPen(Qt.black, self._pixels(rcParams["xtick.major.width"])))
+        # ticks and labels are as long and as far from the axes as the rcParams make them in matplotlib
+        length, pad = self._pixels(rcParams["xtick.major.size"]), self._pixels(rcParams["xtick.major.pad"])
+        tick_font = self._font(rcParams["xtick.labelsize"])
+        painter.setFont(tick_font)
+        metrics = QFontMetricsF(tick_font)
+
+        below = axes.xaxis.get_ticks_position() != "top"
+        edge = rect.bottom() if below else rect.top()
+        sign = 1 if below else -1
+        for value, label in x_ticks:
+            x = to_x(value)
+            painter.drawLine(QPointF(x, edge), QPointF(x, edge + sign * length))
+            box = QRectF(x - 200, edge + sign * (length + pad) - (0 if below else metrics.height()), 400,
+                         metrics.height())
+            painter.drawText(box, Qt.AlignHCenter | (Qt.AlignTop if below else Qt.AlignBottom), label)
+        x_labels_end = edge + sign * (length + pad + (metrics.height() if x_ticks else 0))
+
+        length, pad = self._pixels(rcParams["ytick.major.size"]), self._pixels(rcParams["ytick.major.pad"])
+        right = axes.yaxis.get_ticks_position() == "right"
+        edge = rect.right() if right else rect.left()
+        sign = 1 if right else -1
+        widest = 0
+        for value, label in y_ticks:
+            y = to_y(value)
+            painter.drawLine(QPointF(edge, y), QPointF(edge + sign * length, y))
+            anchor = edge + sign * (length + pad)
+            box = QRectF(anchor if right else anchor - 400, y - metrics.height() / 2, 400, metrics.height())
+            painter.drawText(box, Qt.AlignVCenter | (Qt.AlignLeft if right else Qt.AlignRight), label)
+            widest = max(widest, metrics.width(label))
+        y_labels_end = edge + sign * (length + pad + widest)
+
+        offset = axes.yaxis.get_major_formatter().get_offset() if y_ticks else ""
+        if offset:
+            painter.drawText(QRectF(edge - 200, rect.top() - metrics.height() - pad, 400, metrics.height()),
+                             Qt.AlignHCenter | Qt.AlignBottom, offset)
+        offset = axes.xaxis.get_major_formatter().get_offset() if x_ticks else ""
+        if offset:
+            painter.drawText(QRectF(rect.right() - 400, x_labels_end, 400, metrics.height()),
+                             Qt.AlignRight | Qt.AlignTop, offset)
+
+        title = axes.get_title()
+        if title:
+            font = self._font(axes.title.get_fontsize(), axes.title.get_fontweight())
+            painter.setFont(font)
+            height = QFontMetricsF(font).height() * (title.count("\n") + 1)
+            pad = self._pixels(rcParams["axes.titlepad"])
+            painter.drawText(QRectF(rect.left(), rect.top() - pad - height, rect.width(), height),
+                             Qt.AlignHCenter | Qt.AlignBottom, title)
+        label_pad = self._pixels(rcParams["axes.labelpad"])
+        label = axes.get_xlabel()
+        if label:
+            font = self._font(axes.xaxis.label.get_fontsize())
+            painter.setFont(font)
+            height = QFontMetricsF(font).height()
+            top = x_labels_end + label_pad if below else x_labels_end - label_pad - height
+            painter.drawText(QRectF(rect.left(), top, rect.width(), height), Qt.AlignHCenter | Qt.AlignTop, label)
+        label = axes.get_ylabel()
+        if label:
+            font = self._font(axes.yaxis.label.get_fontsize())
+            painter.setFont(font)
+            height = QFontMetricsF(font).height()
+            painter.save()
+            painter.translate(y_labels_end + sign * label_pad, rect.center().y())
+            painter.rotate(90 if right else -90)
+            painter.drawText(QRectF(-rect.height() / 2, -height if not right else 0, rect.height(), height),
+                             Qt.AlignHCenter | (Qt.AlignBottom if not right else Qt.AlignTop), label)
+            painter.restore()
+
+    def _paint_legend(self, painter, legend, rect):
+        texts = [text.get_text() for text in legend.get_texts()]
+        if not texts:
+            return
+        font = self._font(legend.get_texts()[0].get_fontsize())
+        painter.setFont(font)
+        metrics = QFontMetricsF(font)
+        n_columns = max(min(getattr(legend, "_ncols", 1), len(texts)), 1)
+        n_rows = -(-len(texts) // n_columns)
+        handle, gap, pad = metrics.height() * 2, metrics.height() * 0.8, metrics.height() * 0.5
+        widths = [max(metrics.width(text) for text in texts[column * n_rows:(column + 1) * n_rows])
+                  for column in range(n_columns)]
+        width = sum(handle + gap + w for w in widths) + gap * (n_columns - 1) + 2 * pad
+        height = n_rows * metrics.height() * 1.2 + 2 * pad
+        box = QRectF(rect.right() - width - pad, rect.top() + pad, width, height)
+
+        frame = legend.get_frame()
+        painter.setPen(QPen(_color(frame.get_edgecolor()), self._pixels(frame.get_linewidth())))
+        painter.setBrush(_color(frame.get_facecolor()))
+        painter.drawRoundedRect(box, 2, 2)
+        painter.setRenderHint(QPainter.Antialiasing)
+        x = box.left() + pad
+        for column, column_width in enumerate(widths):
+            for row in range(n_rows):
+                index = column * n_rows + row  # filled column by column, as matplotlib does
+                if index >= len(texts):
+                    break
+                y = box.top() + pad + (row + 0.5) * metrics.height() * 1.2
+                source = legend.legend_handles[index]
+                if source is not None:
+                    pen = QPen(_color(source.get_color(), source.get_alpha()), self._pixels(source.get_linewidth()))
+                    pen.setStyle(pen_styles.get(source.get_linestyle(), Qt.SolidLine))
+                    painter.setPen(pen)
+                    painter.drawLine(QPointF(x, y), QPointF(x + handle, y))
+                painter.setPen(_color(legend.get_texts()[index].get_color()))
+                painter.drawText(QRectF(x + handle + gap, y - metrics.height(), column_width + 1, 2 * metrics.height()),
+                                 Qt.AlignLeft | Qt.AlignVCenter, texts[index])
+            x += handle + gap + column_width + gap
+
+    # ------------------------------------------------------------------ helpers
+
+    def _pixels(self, points):
+        return points * self.dpi / 72
+
+    def _font(self, size, weight="normal"):
+        font = QFont(self.font())
+        font.setPixelSize(max(int(round(self._pixels(FontProperties(size=size).get_size_in_points()))), 1))
+        font.setBold(weight in ("bold", "heavy", "black", "semibold", "demibold") or
+                     isinstance(weight, int) and weight >= 600)
+        return font
+
+    def _color_table(self, cmap, bad):
+        # 255 colors of the colormap, the last index is used for NaN, shown as the background
+        key = (cmap.name, tuple(to_rgba(bad)))
+        if key not in self._color_tables:
+            colors = cmap(linspace(0, 1, 255), bytes=True).tolist() + [[int(255 * c) for c in to_rgba(bad)]]
+            self._color_tables[key] = [(a << 24) | (r << 16) | (g << 8) | b for r, g, b, a in colors]
+        return self._color_tables[key]
+
+    # ------------------------------------------------------------------ interaction
+
+    def _axes_at(self, position):
+        for axes in reversed(self.figure.axes):
+            if getattr(axes, "_colorbar", None) is None and self.axes_rect(axes).contains(position):
+                return axes
+        return None
+
+    def mousePressEvent(self, event):
+        axes = self._axes_at(QPointF(event.pos()))
+        if event.button() == Qt.LeftButton and axes is not None:
+            self._drag = axes, QPointF(event.pos()), axes.get_xlim(), axes.get_ylim()
+        super(QtPlotView, self).mousePressEvent(event)
+
+    def mouseMoveEvent(self, event):
+        if self._drag is not None:
+            axes, start, (x0, x1), (y0, y1) = self._drag
+            rect = self.axes_rect(axes)
+            dx = (event.pos().x() - start.x()) * (x1 - x0) / rect.width()
+            dy = (event.pos().y() - start.y()) * (y1 - y0) / rect.height()
+            axes.set_xlim(x0 - dx, x1 - dx)
+            axes.set_ylim(y0 + dy, y1 + dy)
+            self.update()
+        super(QtPlotView, self).mouseMoveEvent(event)
+
+    def mouseReleaseEvent(self, event):
+        self._drag = None
+        super(QtPlotView, self).mouseReleaseEvent(event)
+
+    def mouseDoubleClickEvent(self, event):
+        self.home_requested.emit()
+
+    def wheelEvent(self, event):
+        axes = self._axes_at(QPointF(event.pos()))
+        if axes is not None and event.angleDelta().y():
+            rect = self.axes_rect(axes)
+            x0, x1 = axes.get_xlim()
+            center = x0 + (event.pos().x() - rect.left()) * (x1 - x0) / rect.width()
+            factor = 0.8 ** (event.angleDelta().y() / 120)
+            axes.set_xlim(center - (center - x0) * factor, center + (x1 - center) * factor)
+            self.update()
+
+
+def _color(color, alpha=None):
+    r, g, b, a = to_rgba(color, alpha)
+    return QColor.fromRgbF(r, g, b, a)
+
+
+def _scale(v0, v1, p0, p1):
+    # data to pixel coordinates, works on numbers and arrays
+    factor = (p1 - p0) / (v1 - v0) if v1 != v0 else 0
+    return lambda value: p0 + (value - v0) * factor
+
+
+def _side(rect, side):
+    return {
+        "left": (rect.topLeft(), rect.bottomLeft()),
+        "right": (rect.topRight(), rect.bottomRight()),
+        "top": (rect.topLeft(), rect.topRight()),
+        "bottom": (rect.bottomLeft(), rect.bottomRight()),
+    }[side]
+
+
+def _ticks(axis, v0, v1):
+    # (value, label) of the major ticks inside the limits, from the locator and formatter of the axis
+    low, high = min(v0, v1), max(v0, v1)
+    slack = (high - low) * 1e-9
+    values = [value for value in axis.get_major_locator().tick_values(low, high)
+              if low - slack <= value <= high + slack]
+    if not values:
+        return []
+    return list(zip(values, axis.get_major_formatter().format_ticks(values)))
+
+
+def _polygon(x, y):
+    # QPolygonF filled in place from the pixel coordinates
+    polygon = QPolygonF(len(x))
+    pointer = polygon.data()
+    pointer.setsize(16 * len(x))
+    frombuffer(pointer, dtype=float).reshape(-1, 2)[:] = column_stack([x, y])
+    return polygon
@@ -0,0 +1,145 @@
+from numpy import asarray, empty, fmax, fmin, full, ix_, nan
+from pandas import DataFrame
+
+
+class SampleStore:
+    """Columnar store of measurements backed by preallocated float arrays.
+
+    Every column lives in a row of a (columns x capacity) buffer that grows by
+    doubling, so appending a sample is amortized O(1). The part of the buffer
+    past the last sample is always NaN. Column access returns
+    NumPy views of the filled part of the buffer and a DataFrame is only built
+    when it is explicitly requested. The lowest and highest value written in
+    every column are tracked as samples are written, so plot limits do not
+    scan the whole store.
+    """
+
+    default_columns = ("time", "T1", "T2", "T3", "T4", "T5", "T6")
+
+    def __init__(self, columns=default_columns, capacity=1024):
+        self.columns = list(columns)
+        self._index = {name: i for i, name in enumerate(self.columns)}
+        self._buffer = empty((len(self.columns), max(int(capacity), 1)))
+        self._buffer.fill(nan)
+        self._size = 0
+        self._changed = None  # first sample index written since the last pop_changed()
+        self._low = full(len(self.columns), nan)  # extrema of every column, NaN values ignored
+        self._high = full(len(self.columns), nan)
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self._buffer[self._index[key], :self._size]
+        rows = [self._index[name] for name in key]
+        return self._buffer[rows, :self._size]
+
+    @property
+    def shape(self):
+        return self._size, len(self.columns)
+
+    @property
+    def capacity(self):
+        return self._buffer.shape[1]
+
+    @property
+    def values(self):
+        # (columns x samples) view of the filled part of the buffer
+        return self._buffer[:, :self._size]
+
+    @property
+    def channels(self):
+        # (channels x samples) view, i.e. every column except time
+        return self._buffer[1:, :self._size]
+
+    def last(self, column):
+        return self._buffer[self._index[column], self._size - 1]
+
+    def reserve(self, n_samples):
+        if n_samples <= self.capacity:
+            return
+        new_capacity = self.capacity
+        while new_capacity < n_samples:
+            new_capacity *= 2
+
+        buffer = empty((len(self.columns), new_capacity))
+        buffer[:, :self._size] = self._buffer[:, :self._size]
+        buffer[:, self._size:] = nan
+        self._buffer = buffer
+
+    def append(self, sample):
+        """Append one sample, given as a {column: value} dict or a sequence
+        ordered like ``columns``. Missing dict entries are stored as NaN."""
+        self.reserve(self._size + 1)
+        if isinstance(sample, dict):
+            column = self._buffer[:, self._size]
+            for name, value in sample.items():
+                column[self._index[name]] = value
+        else:
+            self._buffer[:, self._size] = sample
+        self._track(slice(None), self._buffer[:, self._size:self._size + 1].T)
+        self._mark_changed(self._size)
+        self._size += 1
+
+    def extend(self, samples):
+        """Append a (samples x columns) array in a single copy."""
+        samples = asarray(samples, dtype=float)
+        if samples.ndim == 1:
+            samples = samples.reshape(1, -1)
+        n = samples.shape[0]
+        if n == 0:
+            return
+        self.reserve(self._size + n)
+        self._buffer[:, self._size:self._size + n] = samples.T
+        self._track(slice(None), samples)
+        self._mark_changed(self._size)
+        self._size += n
+
+    def put(self, rows, columns, values):
+        """Write a (len(rows) x len(columns)) array at the given sample indexes,
+        which may be past the end of the store: the store grows to the last
+        index and the slots nobody wrote yet stay NaN."""
+        rows = asarray(rows, dtype=int)
+        if rows.size == 0:
+            return
+        end = int(rows.max()) + 1
+        self.reserve(end)
+        self._size = max(self._size, end)
+        indexes = [self._index[name] for name in columns]
+        values = asarray(values, dtype=float)
+        self._buffer[ix_(indexes, rows)] = values.T
+        self._track(indexes, values)
+        self._mark_changed(int(rows.min()))
+
+    def _track(self, indexes, values):
+        # values is a (samples x columns) array of the columns at indexes
+        self._low[indexes] = fmin(self._low[indexes], fmin.reduce(values, axis=0))
+        self._high[indexes] = fmax(self._high[indexes], fmax.reduce(values, axis=0))
+
+    def extrema(self, columns):
+        """Lowest and highest value written in the given columns (NaN if
+        none was), overwritten values included."""
+        indexes = [self._index[name] for name in columns]
+        return fmin.reduce(self._low[indexes]), fmax.reduce(self._high[indexes])
+
+    def _mark_changed(self, index):
+        if self._changed is None or index < self._changed:
+            self._changed = index
+
+    def pop_changed(self):
+        """First sample index written since the previous call (None if nothing
+        was), so views can refresh only what changed."""
+        changed, self._changed = self._changed, None
+        return changed
+
+    def clear(self):
+        self._buffer[:, :self._size] = nan
+        self._size = 0
+        self._changed = 0
+        self._low[:] = nan
+        self._high[:] = nan
+
+    def to_dataframe(self):
+        # the transposed view is already laid out as pandas stores a float block
+        return DataFrame(self.values.T, columns=self.columns, copy=False)
@@ -0,0 +1,87 @@
+import logging
+from collections import deque
+from logging import DEBUG, INFO, WARNING
+from logging.handlers import RotatingFileHandler
+
+from PyQt5 import QtCore, QtGui
+
+
+LEVELS = {"DEBUG": DEBUG, "INFO": INFO, "WARNING": WARNING}
+
+
+class SerialLog(QtCore.QObject):
+    """Bounded, rate-limited log shown in the serial monitor.
+
+    log() can be called from any thread: messages are only appended to a
+    capped ring (deque appends are atomic) and, if a trace file is set, written
+    to a rotating file from the calling thread. The widget is updated from the
+    GUI thread by a timer at flush_rate Hz with a single append of every new
+    message at or above the current level, and its document is capped to the
+    ring capacity, so verbose wire logging does not cost GUI frame time.
+    """
+
+    def __init__(self, textedit, capacity=2000, flush_rate=10, level=INFO,
+                 trace_file=None, trace_size=5000000, trace_backups=3, parent=None):
+        super(SerialLog, self).__init__(parent)
+        self.textedit = textedit
+        self.textedit.setMaximumBlockCount(capacity)
+        self.level = level
+        self._ring = deque(maxlen=capacity)
+        self._new = deque(maxlen=capacity)
+
+        self._trace = None
+        if trace_file:
+            handler = RotatingFileHandler(trace_file, maxBytes=trace_size, backupCount=trace_backups)
+            handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+            self._trace = logging.getLogger("tms.trace")
+            self._trace.setLevel(DEBUG)
+            self._trace.propagate = False
+            self._trace.addHandler(handler)
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.timeout.connect(self.flush)
+        self._timer.start(int(1000 / flush_rate))
+
+    def log(self, message, level=INFO):
+        record = (level, message)
+        self._ring.append(record)
+        self._new.append(record)
+        if self._trace is not None:
+            self._trace.log(level, message)
+
+    def debug(self, message):
+        self.log(message, DEBUG)
+
+    def info(self, message):
+        self.log(message, INFO)
+
+    def warning(self, message):
+        self.log(message, WARNING)
+
+    def flush(self):
+        lines = []
+        while self._new:
+            level, message = self._new.popleft()
+            if level >= self.level:
+                lines.append(message)
+        if lines:
+            self.textedit.appendPlainText("\n".join(lines))
+
+    def set_level(self, level):
+        # the widget is rebuilt from the ring, so lowering the level shows the recent history
+        self.level = level
+        self._new.clear()
+        self.textedit.setPlainText("\n".join(m for lv, m in list(self._ring) if lv >= level))
+        self.textedit.moveCursor(QtGui.QTextCursor.End)
+
+    def clear(self):
+        self._ring.clear()
+        self._new.clear()
+        self.textedit.clear()
+
+    def close(self):
+        self._timer.stop()
+        if self._trace is not None:
+            for handler in list(self._trace.handlers):
+                self._trace.removeHandler(handler)
+                handler.close()
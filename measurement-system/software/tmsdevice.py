@@ -0,0 +1,401 @@
+import asyncio
+import math
+from logging import DEBUG, WARNING
+
+from tmsprotocol import (
+    accepted_reply, batch_command, decode_frames, parse_measurements, parse_status, BATCH_HEADER, BINARY_MODE_OK,
+    BUFFER_EMPTY, BUFFER_FULL, END_OF_BATCH, EXPECTED_REPLIES, FRAME_SIZE, JSON_MODE_OK, MEASUREMENT_COMMANDS, STATUS,
+    STATUS_REPLY,
+)
+
+# status of a device whose port failed while sampling, it is not a reply of the firmware
+PORT_FAILED = "PORT_FAILED"
+
+
+class _PendingCommand:
+    def __init__(self, command, future):
+        self.command = command
+        self.name = (command.split() or [""])[0]
+        self.future = future
+        self.expected = EXPECTED_REPLIES.get(self.name, ())
+        self.measurements = self.name in MEASUREMENT_COMMANDS
+        self.lines = []
+
+    def accepts(self, line):
+        if self.measurements:
+            return line in (END_OF_BATCH, BUFFER_EMPTY) or line.startswith("{") \
+                or line.startswith(BATCH_HEADER)
+        if self.name == STATUS:
+            return line.startswith(STATUS_REPLY)
+        return line in self.expected
+
+
+class CommandResult:
+    """Outcome of a pipeline of control commands sent to one or more devices.
+
+    `replies` maps every command to the reply of each device, None where a
+    device did not answer within its retries. A command is accepted when every
+    device answered it with its accepted reply.
+    """
+
+    def __init__(self, commands, elapsed=0.0):
+        self.replies = {command: [] for command in commands}
+        self.elapsed = elapsed
+
+    def accepted(self, command):
+        replies = self.replies[command]
+        return bool(replies) and all(reply == accepted_reply(command) for reply in replies)
+
+    @property
+    def unanswered(self):
+        return [command for command, replies in self.replies.items() if None in replies]
+
+
+class PollScheduler:
+    """Adapts the poll interval and batch size to the fill level of the device queue.
+
+    Every poll aims to find `target` measurements queued: enough to not waste
+    round trips on empty batches, and no more than the `low`..`high` band of
+    the queue capacity or max_interval worth of samples, so the queue keeps
+    room to absorb a stalled host. The interval is corrected by the ratio
+    between the target and the measurements actually drained (at most x2 per
+    poll), starting from the shortest interval.
+
+    The batch size (the GETN limit) follows the same measurements: it is
+    twice those expected by the next poll, from the drain rate observed or
+    the sampling rate if higher, and at most the `high` fraction of the
+    queue, so replies stay short while the queue is low. A full batch is
+    followed by an immediate poll with the largest batch.
+    """
+
+    def __init__(self, sampling_interval, capacity, max_interval=1.0, low=0.25, high=0.5):
+        self.sampling_interval = sampling_interval
+        self.capacity = max(capacity, 1)
+        self.low = low
+        self.high = high
+        self.max_batch_size = max(int(math.ceil(high * self.capacity)), 1)
+        self.batch_size = self.max_batch_size  # the queue may already hold more than a poll's worth
+        self.target = max(min((low + high) / 2 * self.capacity, max_interval / sampling_interval), 1)
+        self.max_interval = min(max_interval, high * self.capacity * sampling_interval)
+        self.min_interval = min(sampling_interval / 2, self.max_interval)
+        self.interval = self.min_interval  # start fast and back off, the queue may already be filling
+
+    def update(self, drained):
+        """Take the number of measurements drained by the last poll; returns
+        the time to wait before the next one."""
+        if drained >= self.batch_size:
+            # the queue may still hold more than a batch
+            self.interval = self.min_interval
+            self.batch_size = self.max_batch_size
+            return 0.0
+        ratio = min(max(self.target / drained, 0.5), 2.0) if drained else 2.0
+        elapsed = self.interval  # since the last poll
+        self.interval = min(max(self.interval * ratio, self.min_interval), self.max_interval)
+        expected = self.interval * max(drained / elapsed, 1.0 / self.sampling_interval)
+        self.batch_size = min(max(int(math.ceil(2 * expected)), 1), self.max_batch_size)
+        return self.interval
+
+
+class TMSDevice:
+    """asyncio client of the TMS serial protocol.
+
+    Replies are read from the serial file descriptor with loop.add_reader
+    (or from an executor where the port has no file descriptor, e.g. on
+    Windows) and matched to the oldest pending command that expects them, so
+    several commands can be in flight at once. Control commands resolve to
+    their reply token; GET/GETALL/GETN resolve to a (status, values, failed)
+    tuple like tmsprotocol.read_batch.
+    """
+
+    def __init__(self, serial_port, binary=False, timeout=5.0, log=None):
+        self.serial_port = serial_port
+        self.binary = binary  # "B n" frame batches are read only in binary mode, MBOK/MJOK set it
+        self.timeout = timeout
+        self.log = log or (lambda message, level=None: None)
+        self.status = None
+        self.error = None  # the exception that made the port fail, if it did
+        self.started_at = None  # loop time at which STAOK was received
+        self.scheduler = None  # PollScheduler of the current sampling, if adaptive
+
+        self._loop = None
+        self._fd = None
+        self._reader_task = None
+        self._buffer = bytearray()
+        self._pending = []
+        self._frames = None  # (pending command or None, number of frames) while reading a binary batch
+        self._full_reported = False
+        self._sampling = False
+
+    # -------------------------------------- transport ---------------------------------------------
+    async def open(self):
+        self._loop = asyncio.get_running_loop()
+        try:
+            fd = self.serial_port.fileno()
+        except (AttributeError, OSError):
+            fd = None
+
+        if fd is not None:
+            self.serial_port.timeout = 0  # reads return what is available, never block
+            self._fd = fd
+            self._loop.add_reader(fd, self._on_readable)
+        else:
+            self.serial_port.timeout = 0.05
+            self._reader_task = self._loop.create_task(self._read_in_executor())
+
+    def close(self):
+        self._stop_reading()
+        self._fail_pending(ConnectionError("device closed"))
+
+    def _stop_reading(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            self._reader_task = None
+        elif self._fd is not None:
+            self._loop.remove_reader(self._fd)
+            self._fd = None
+
+    def _fail_pending(self, error):
+        for pending in self._pending:
+            if not pending.future.done():
+                pending.future.set_exception(error)
+        self._pending = []
+
+    def _port_failed(self, error):
+        # a failed port stays readable and every read raises again, it is not read anymore
+        self.error = error
+        self._reader_task = None  # if there is one it is the caller, it returns right after
+        self._stop_reading()
+        self.log("Fail readed " + str(error) + ", device disconnected", WARNING)
+        self._fail_pending(ConnectionError("device disconnected: " + str(error)))
+
+    def _on_readable(self):
+        try:
+            data = self.serial_port.read(max(self.serial_port.in_waiting, 1))
+        except Exception as e:
+            self._port_failed(e)
+            return
+        self.feed(data)
+
+    async def _read_in_executor(self):
+        while True:
+            try:
+                data = await self._loop.run_in_executor(
+                    None, lambda: self.serial_port.read(max(self.serial_port.in_waiting, 1))
+                )
+            except Exception as e:
+                self._port_failed(e)
+                return
+            self.feed(data)
+
+    def feed(self, data):
+        """Parse received bytes and resolve the commands they answer."""
+        self._buffer += data
+        while True:
+            if self._frames is not None:
+                pending, n_frames = self._frames
+                if len(self._buffer) < n_frames * FRAME_SIZE:
+                    return
+                data = bytes(self._buffer[:n_frames * FRAME_SIZE])
+                del self._buffer[:n_frames * FRAME_SIZE]
+                self._frames = None
+                values, failed = decode_frames(data, n_frames)
+                self._resolve_batch(pending, END_OF_BATCH, values, failed)
+                continue
+
+            end = self._buffer.find(b"\n")
+            if end == -1:
+                return
+            line = self._buffer[:end].decode("utf-8", errors="replace").strip()
+            del self._buffer[:end + 1]
+            if line:
+                self._on_line(line)
+
+    def _on_line(self, line):
+        if line == BUFFER_FULL:
+            # printed by the firmware loop(), reported with the next batch
+            self._full_reported = True
+            return
+
+        pending = next((p for p in self._pending if p.accepts(line)), None)
+
+        if line.startswith(BATCH_HEADER) and line[len(BATCH_HEADER):].isdigit():
+            if self.binary:
+                # the frames must be consumed even if nobody waits for them anymore
+                self._frames = (pending, int(line[len(BATCH_HEADER):]))
+                return
+            pending = None  # no frames are expected in JSON mode
+
+        if pending is None:
+            self.log("unexpected response: " + line, WARNING)
+            return
+
+        if not pending.measurements:
+            self._pending.remove(pending)
+            self.log("response: " + line, DEBUG)
+            if line == "STAOK":
+                self.started_at = self._loop.time()
+            elif line == BINARY_MODE_OK or line == JSON_MODE_OK:
+                # the replies that follow are in the mode the firmware acknowledged
+                self.binary = line == BINARY_MODE_OK
+            if not pending.future.done():
+                pending.future.set_result(line)
+
+        elif line.startswith("{"):
+            pending.lines.append(line)
+            if pending.name == "GET":
+                self._finish_json_batch(pending, END_OF_BATCH)
+        else:
+            self._finish_json_batch(pending, line)
+
+    def _finish_json_batch(self, pending, status):
+        values, failed = parse_measurements(pending.lines)
+        self._resolve_batch(pending, status, values, failed)
+
+    def _resolve_batch(self, pending, status, values, failed):
+        if self._full_reported:
+            status = BUFFER_FULL
+            self._full_reported = False
+        if pending is None:
+            return
+        if pending in self._pending:
+            self._pending.remove(pending)
+        self.log("response: " + str(len(values)) + " measurements, " + str(status), DEBUG)
+        if not pending.future.done():
+            pending.future.set_result((status, values, failed))
+
+    # -------------------------------------- commands ----------------------------------------------
+    def command(self, command, timeout=None):
+        """Send a command now and return an awaitable of its reply (see the
+        class docstring), so commands are written in the order they are
+        made. The reply raises ConnectionError once the port has failed."""
+        pending = _PendingCommand(command, self._loop.create_future())
+        if self.error is not None:
+            pending.future.set_exception(ConnectionError("device disconnected: " + str(self.error)))
+            return self._reply(pending, timeout)
+        self._pending.append(pending)
+        self.log("request: " + command, DEBUG)
+        try:
+            self.serial_port.write(str.encode(command + "\n"))
+        except Exception as e:
+            pending.future.set_exception(e)
+        return self._reply(pending, timeout)
+
+    async def _reply(self, pending, timeout):
+        try:
+            return await asyncio.wait_for(
+                pending.future, self.timeout if timeout is None else timeout
+            )
+        finally:
+            if pending in self._pending:
+                self._pending.remove(pending)
+
+    def request(self, command, timeout=None, retries=0):
+        """Send a command now (see command()), resending it up to `retries`
+        times while its reply does not arrive before the timeout. The
+        awaitable returns None if it never did."""
+        return self._retry(self.command(command, timeout), command, timeout, retries)
+
+    async def _retry(self, reply, command, timeout, retries):
+        for attempt in range(retries + 1):
+            try:
+                return await reply
+            except asyncio.TimeoutError:
+                self.log("Fail readed: no response to " + command, WARNING)
+            if attempt < retries:
+                reply = self.command(command, timeout)
+        return None
+
+    def pipeline(self, commands, timeout=None, retries=0):
+        """Send the commands now, back to back, without waiting for a reply in
+        between; the awaitable returns their replies in order (see request())."""
+        return asyncio.gather(*(self.request(command, timeout, retries) for command in commands))
+
+    async def start(self):
+        return await self.command("START") == "STAOK"
+
+    async def stop(self):
+        return await self.command("STOP") == "STOOK"
+
+    async def clear(self):
+        return await self.command("CLEAR") == "CLROK"
+
+    async def set_sampling(self, sampling_time):
+        return await self.command("SETS " + str(sampling_time)) == "SSOK"
+
+    async def set_analysis(self, analysis_time):
+        return await self.command("SETA " + str(analysis_time)) == "SAOK"
+
+    async def set_buffer_size(self, buffer_size):
+        return await self.command("BSIZE " + str(buffer_size)) == "BSOK"
+
+    async def get(self):
+        return await self.command("GET")
+
+    async def get_all(self, max_items=None):
+        return await self.command(batch_command(max_items))
+
+    async def queue_status(self, timeout=None):
+        """(queued items, queue capacity) of the device, None if it does not answer STATUS."""
+        try:
+            return parse_status(await self.command(STATUS, timeout))
+        except asyncio.TimeoutError:
+            self.log("Fail readed: no response to " + STATUS, WARNING)
+        except OSError as e:
+            self.log("Fail readed " + str(e), WARNING)
+        return None
+
+    # -------------------------------------- sampling ----------------------------------------------
+    async def samples(self, interval, max_interval=None):
+        """Async iterator of (values, failed) batches, draining the device until
+        it reports BE/BF (kept in `status`) or stop_sampling() is called. If the
+        port fails it ends with `status` PORT_FAILED.
+
+        interval is the sampling interval of the device in seconds. With
+        max_interval the device queue is read with STATUS and polled by a
+        PollScheduler, polls are never further apart than max_interval;
+        otherwise (or if STATUS is not answered) it is polled every interval.
+        """
+        self.status = None
+        self._sampling = True
+        next_poll = self._loop.time()
+
+        self.scheduler = None
+        if max_interval is not None and self.error is None:
+            status = await self.queue_status(timeout=min(self.timeout, 1.0))
+            if status is not None:
+                self.scheduler = PollScheduler(interval, status[1], max_interval)
+                self.log("adaptive polling: queue " + str(status[0]) + "/" + str(status[1]), DEBUG)
+
+        while self._sampling:
+            max_items = self.scheduler.batch_size if self.scheduler is not None else None
+            try:
+                status, values, failed = await self.get_all(max_items)
+            except asyncio.TimeoutError:
+                self.log("Fail readed: no response to " + batch_command(max_items), WARNING)
+                status, values, failed = None, (), 0
+            except OSError as e:
+                # SerialException, ConnectionError: the port failed or was closed, nothing more will come
+                if self.error is None:
+                    self.log("Fail readed " + str(e), WARNING)
+                self.status = PORT_FAILED
+                break
+
+            if len(values):
+                yield values, failed
+            if status == BUFFER_EMPTY or status == BUFFER_FULL:
+                self.status = status
+                break
+
+            if self.scheduler is not None:
+                wait = self.scheduler.update(len(values) + failed)
+            else:
+                wait = interval
+            # keep the cadence, but do not try to catch up polls missed on a slow response
+            next_poll = max(next_poll + wait, self._loop.time())
+            while self._sampling and self._loop.time() < next_poll:
+                await asyncio.sleep(min(next_poll - self._loop.time(), 0.05))
+
+        self._sampling = False
+
+    def stop_sampling(self):
+        self._sampling = False
@@ -0,0 +1,445 @@
+# ================================================================
+# Software emulator of the TMS device firmware (hardware/src/src.ino)
+# served over a pseudo-terminal, so the GUI and the serial protocol
+# can be exercised and benchmarked without the board.
+
+# usage: python tmsemulator.py            -> prints the port to connect to
+#        python tmsemulator.py --gui      -> opens the GUI connected to the emulator
+#        python tmsemulator.py --bench    -> GET vs GETALL (JSON/binary) ingest benchmark
+#        python tmsemulator.py --help     -> clock, profile, noise and fault options
+# ================================================================
+
+
+import os
+import sys
+import time
+import math
+import random
+import struct
+import select
+import binascii
+import tty
+import argparse
+import threading
+from collections import deque
+
+
+# ------------------------------------ thermal profiles ------------------------------------------
+# a profile maps the device time (seconds) to the temperatures of the six thermocouples
+
+def constant_profile(temperature=25.0):
+    return lambda t: [temperature] * 6
+
+
+def ramp_soak_profile(ambient=25.0, setpoint=150.0, rate=0.5, soak=600.0, gradient=2.0):
+    """Ramp at `rate` °C/s up to setpoint, hold for `soak` seconds and cool back
+    down at the same rate; every channel reads `gradient` °C less than the previous."""
+    ramp_time = (setpoint - ambient) / rate
+
+    def profile(t):
+        if t < ramp_time:
+            temperature = ambient + rate * t
+        elif t < ramp_time + soak:
+            temperature = setpoint
+        else:
+            temperature = max(setpoint - rate * (t - ramp_time - soak), ambient)
+        heating = (temperature - ambient) / (setpoint - ambient)
+        return [temperature - gradient * i * heating for i in range(6)]
+
+    return profile
+
+
+def oven_profile(ambient=25.0, setpoint=120.0, tau=300.0, gradient=3.0, ripple=0.5, period=60.0):
+    """First-order heating towards setpoint with time constant `tau`, a
+    thermocouple-dependent offset along the oven and a small controller ripple."""
+    def profile(t):
+        heating = 1 - math.exp(-t / tau)
+        return [
+            ambient + (setpoint - gradient * i - ambient) * heating
+            + ripple * heating * math.sin(2 * math.pi * t / period + i)
+            for i in range(6)
+        ]
+
+    return profile
+
+
+PROFILES = {"constant": constant_profile, "ramp": ramp_soak_profile, "oven": oven_profile}
+
+
+class Faults:
+    """Faults injected by the emulator.
+
+    garble_rate: probability that a reply (line or binary frame) is corrupted
+    nan_channels: thermocouples (1 to 6) always reported as not attached
+    nan_rate: probability that any other channel is reported as not attached
+    latency_rate, latency: probability and duration (s) of a stalled reply
+    """
+
+    def __init__(self, garble_rate=0.0, nan_channels=(), nan_rate=0.0, latency_rate=0.0, latency=1.0):
+        self.garble_rate = garble_rate
+        self.nan_channels = set(nan_channels)
+        self.nan_rate = nan_rate
+        self.latency_rate = latency_rate
+        self.latency = latency
+
+    def is_open(self, channel):
+        return channel in self.nan_channels or random.random() < self.nan_rate
+
+    def garble(self, data):
+        if not data or random.random() >= self.garble_rate:
+            return data
+        data = bytearray(data)
+        for _ in range(random.randint(1, 3)):
+            # never touch the line terminator, a garbled line is still a line
+            data[random.randrange(max(len(data) - 2, 1))] = random.randrange(32, 127)
+        return bytes(data)
+
+    def delay(self):
+        return self.latency if random.random() < self.latency_rate else 0.0
+
+
+class TMSEmulator:
+    """Model of the TMS firmware command set and measurement queue.
+
+    speed scales the device clock (e.g. 60 runs a one hour profile in a
+    minute) and min_sampling_time is the lowest sampling time accepted by
+    SETS (240 ms in the firmware).
+    """
+
+    def __init__(self, sampling_time=250, analysis_time=10000, buffer_size=40,
+                 max_buffer_size=40, speed=1.0, min_sampling_time=240,
+                 profile=None, noise=0.25, faults=None):
+        self.sampling_time = sampling_time
+        self.analysis_time = analysis_time
+        self.buffer_size = buffer_size
+        self.max_buffer_size = max_buffer_size
+        self.speed = speed
+        self.min_sampling_time = min_sampling_time
+        self.profile = profile or constant_profile()
+        self.noise = noise
+        self.faults = faults or Faults()
+
+        self.start = False
+        self.binary_mode = False
+        self.queue = deque()
+        self.seq_counter = 0
+        self.analysis_counter = 0
+        self.update_analysis_max_counter()
+        self._t0 = time.monotonic()
+        self.next_time = self.millis()
+
+    def millis(self):
+        return int((time.monotonic() - self._t0) * 1000 * self.speed)
+
+    def update_analysis_max_counter(self):
+        # integer division in the firmware, the ceil() there gets an already floored value
+        self.analysis_max_counter = self.analysis_time // self.sampling_time
+
+    def measure(self, stamp):
+        # MAX6675 readings are quantized to 0.25 °C, NaN marks an open thermocouple
+        return [
+            float("nan") if self.faults.is_open(i + 1)
+            else round((temperature + random.gauss(0, self.noise)) * 4) / 4
+            for i, temperature in enumerate(self.profile(stamp / 1000.0))
+        ]
+
+    @staticmethod
+    def format_measurement(measurement):
+        # Arduino's String(float) prints two decimals
+        seq, stamp, values = measurement
+        return '{{"seq":{},"t":{}'.format(seq, stamp) + "".join(
+            ',"T{}":{}'.format(i + 1, "NaN" if value != value else "{:.2f}".format(value))
+            for i, value in enumerate(values)
+        ) + "}"
+
+    @staticmethod
+    def format_frame(measurement):
+        # same layout as MMAX6675::write_frame
+        seq, stamp, values = measurement
+        raw = [0 if value != value else int(round(value * 4)) & 0xFFF for value in values]
+        open_bits = sum(1 << i for i, value in enumerate(values) if value != value)
+        body = struct.pack("<HI6HB", seq & 0xFFFF, stamp & 0xFFFFFFFF, *raw, open_bits)
+        return b"\xa5\x5a" + body + struct.pack("<H", binascii.crc_hqx(body, 0))
+
+    def send_measurements(self, n_items):
+        measurements = [self.queue.popleft() for _ in range(n_items)]
+        if self.binary_mode:
+            return ["B " + str(n_items)] + [self.format_frame(m) for m in measurements]
+        return [self.format_measurement(m) for m in measurements] + ["EOB"]
+
+    def update(self):
+        """Run the firmware loop() up to the current time; returns lines printed by it."""
+        lines = []
+        now = self.millis()
+        # absolute schedule: every measurement is stamped with the time of its slot
+        if self.start and now >= self.next_time:
+            if self.analysis_counter < self.analysis_max_counter:
+                seq = self.seq_counter
+                self.seq_counter = (self.seq_counter + 1) & 0xFFFF
+                if len(self.queue) < self.buffer_size:
+                    self.queue.append((seq, self.next_time, self.measure(self.next_time)))
+                else:
+                    lines.append("BF")
+                    self.start = False
+                self.next_time += self.sampling_time
+                # loop() held up for more than a period skips the missed slots, keeping the phase
+                while now >= self.next_time:
+                    self.next_time += self.sampling_time
+                self.analysis_counter += 1
+            else:
+                self.start = False
+        return lines
+
+    def handle_command(self, command):
+        """Process one command as serialEvent() does; returns the reply lines,
+        where binary frames are given as bytes."""
+        command = command.strip()
+
+        if command == "START":
+            self.analysis_counter = 0
+            self.queue.clear()
+            self.seq_counter = 0
+            self.next_time = self.millis() + self.sampling_time
+            self.start = True
+            return ["STAOK"]
+
+        elif command == "STOP":
+            self.start = False
+            return ["STOOK"]
+
+        elif command == "GET":
+            if self.queue:
+                if self.binary_mode:
+                    return self.send_measurements(1)
+                return [self.format_measurement(self.queue.popleft())]
+            return ["BE"]
+
+        elif command == "GETALL" or command.startswith("GETN"):
+            n_items = len(self.queue)
+            if command.startswith("GETN"):
+                max_items = _to_int(command[4:])
+                if 0 < max_items < n_items:
+                    n_items = max_items
+            if not n_items and not self.start:
+                return ["BE"]  # an empty batch while measuring, BE once stopped
+            return self.send_measurements(n_items)
+
+        elif command == "STATUS":
+            return ["ST {} {}".format(len(self.queue), self.buffer_size)]
+
+        elif command.startswith("MODE"):
+            mode = command[4:].strip()
+            if mode == "BIN":
+                self.binary_mode = True
+                return ["MBOK"]
+            elif mode == "JSON":
+                self.binary_mode = False
+                return ["MJOK"]
+            return ["MNOK"]
+
+        elif command.startswith("SETS"):
+            new_sampling_time = _to_int(command[4:])
+            if new_sampling_time >= self.min_sampling_time:
+                self.sampling_time = new_sampling_time
+                return ["SSOK"]
+            return ["SSNOK"]
+
+        elif command.startswith("SETA"):
+            new_analysis_time = _to_int(command[4:])
+            if new_analysis_time < self.sampling_time:
+                return ["SANOK"]
+            self.analysis_time = new_analysis_time
+            self.update_analysis_max_counter()
+            return ["SAOK"]
+
+        elif command == "CLEAR":
+            self.queue.clear()
+            return ["CLROK"]
+
+        elif command.startswith("BSIZE"):
+            new_buffer_size = _to_int(command[5:])
+            if not self.start and len(self.queue) <= new_buffer_size <= self.max_buffer_size:
+                self.buffer_size = new_buffer_size
+                return ["BSOK"]
+            return ["BSNOK"]
+
+        return []
+
+
+def _to_int(text):
+    # mimics Arduino's String::toInt(), which returns 0 on invalid input
+    try:
+        return int(text.strip())
+    except ValueError:
+        return 0
+
+
+class PtyServer(threading.Thread):
+    """Serves a TMSEmulator on the master side of a pseudo-terminal."""
+
+    def __init__(self, emulator, command_timeout=1.0, baudrate=None):
+        super(PtyServer, self).__init__(daemon=True)
+        self.emulator = emulator
+        # a pty has no line speed, replies are paced to baudrate (8N1) when it is given
+        self.baudrate = baudrate
+        # like Serial.readStringUntil('\n'), an unterminated command is taken after a timeout
+        self.command_timeout = command_timeout
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self._running = True
+
+    def stop(self):
+        self._running = False
+
+    def write_lines(self, lines):
+        if not lines:
+            return
+        faults = self.emulator.faults
+        data = b"".join(
+            faults.garble(line if isinstance(line, bytes) else (line + "\r\n").encode())
+            for line in lines
+        )
+        time.sleep(faults.delay())
+        while data:
+            written = os.write(self.master, data)
+            if self.baudrate:
+                time.sleep(written * 10.0 / self.baudrate)
+            data = data[written:]
+
+    def run(self):
+        pending = b""
+        last_read = time.monotonic()
+        while self._running:
+            readable, _, _ = select.select([self.master], [], [], 0.001)
+            if readable:
+                try:
+                    pending += os.read(self.master, 4096)
+                except OSError:
+                    break
+                last_read = time.monotonic()
+
+            while b"\n" in pending:
+                command, pending = pending.split(b"\n", 1)
+                self.write_lines(self.emulator.handle_command(command.decode(errors="replace")))
+
+            if pending and time.monotonic() - last_read > self.command_timeout:
+                self.write_lines(self.emulator.handle_command(pending.decode(errors="replace")))
+                pending = b""
+
+            self.write_lines(self.emulator.update())
+
+
+def benchmark(seconds=5.0, speed=100.0, poll_interval=0.05, baudrate=115200):
+    """Compare per-sample GET polling against GETALL batches in JSON and binary
+    mode on an emulated device, polling every poll_interval seconds as the GUI
+    timer does and pacing the replies to baudrate."""
+    import serial
+    from numpy import zeros
+    from samplestore import SampleStore
+    from tmsprotocol import (
+        batch_command, parse_measurement, read_batch, read_line, BINARY_MODE
+    )
+
+    results = {}
+    for mode in ("GET", "GETALL JSON", "GETALL BIN"):
+        emulator = TMSEmulator(
+            analysis_time=10**9, buffer_size=10**6, max_buffer_size=10**6, speed=speed
+        )
+        server = PtyServer(emulator, baudrate=baudrate)
+        server.start()
+        port = serial.Serial(server.port, baudrate, timeout=1)
+        store = SampleStore()
+        round_trips = 0
+        binary = mode.endswith("BIN")
+
+        if binary:
+            port.write((BINARY_MODE + "\n").encode())
+            read_line(port)
+        port.write(b"START\n")
+        read_line(port)
+        t_end = time.monotonic() + seconds
+        while time.monotonic() < t_end:
+            time.sleep(poll_interval)
+            round_trips += 1
+            if mode == "GET":
+                port.write(b"GET\n")
+                res = read_line(port)
+                if res and res != "BE":
+                    store.append([0] + parse_measurement(res)[2:])
+            else:
+                port.write((batch_command() + "\n").encode())
+                _, values, _ = read_batch(port, binary)
+                batch = zeros((len(values), 7))
+                batch[:, 1:] = values[:, 2:]
+                store.extend(batch)
+
+        port.write(b"STOP\n")
+        server.stop()
+        port.close()
+        results[mode] = (len(store), round_trips, len(emulator.queue))
+
+    produced_rate = 1000.0 * speed / TMSEmulator().sampling_time
+    print("device rate: {:.0f} samples/s, {} baud".format(produced_rate, baudrate))
+    for mode, (n, round_trips, backlog) in results.items():
+        print("{:>11}: {:>8.0f} samples/s, {:>6} round trips, {:>6} samples left queued".format(
+            mode, n / seconds, round_trips, backlog))
+
+
+def run_gui(port):
+    """Open the GUI with the emulator port selected in the connection page."""
+    from PyQt5 import QtCore, QtWidgets
+    import main
+
+    QtWidgets.QApplication.setAttribute(QtCore.Qt.AA_EnableHighDpiScaling)
+    app = QtWidgets.QApplication(sys.argv)
+    ui = main.MS_interface()
+    ui.COM_combobox.addItem(port)
+    ui.COM_combobox.setCurrentText(port)
+    ui.show()
+    return app.exec_()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TMS device emulator over a pseudo-terminal")
+    parser.add_argument("--speed", type=float, help="device clock speed-up factor (1, or 100 with --bench)")
+    parser.add_argument("--min-sampling", type=int, default=240, help="lowest sampling time accepted by SETS (ms)")
+    parser.add_argument("--buffer-size", type=int, default=40, help="initial queue size")
+    parser.add_argument("--max-buffer-size", type=int, default=40, help="largest queue size accepted by BSIZE")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="oven", help="thermal profile")
+    parser.add_argument("--noise", type=float, default=0.25, help="standard deviation of the noise (°C)")
+    parser.add_argument("--garble", type=float, default=0.0, help="probability of a corrupted reply")
+    parser.add_argument("--nan-channels", type=int, nargs="*", default=[], help="thermocouples reported as open")
+    parser.add_argument("--nan-rate", type=float, default=0.0, help="probability of an open channel")
+    parser.add_argument("--latency-rate", type=float, default=0.0, help="probability of a stalled reply")
+    parser.add_argument("--latency", type=float, default=1.0, help="duration of a stalled reply (s)")
+    parser.add_argument("--baud", type=int, default=115200, help="line speed emulated by the pty")
+    parser.add_argument("--gui", action="store_true", help="open the GUI connected to the emulator")
+    parser.add_argument("--bench", action="store_true", help="run the GET vs GETALL benchmark")
+    parser.add_argument("--seconds", type=float, default=5.0, help="benchmark duration")
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(args.seconds, args.speed or 100.0, baudrate=args.baud)
+        sys.exit(0)
+
+    emulator = TMSEmulator(
+        buffer_size=args.buffer_size,
+        max_buffer_size=args.max_buffer_size,
+        speed=args.speed or 1.0,
+        min_sampling_time=args.min_sampling,
+        profile=PROFILES[args.profile](),
+        noise=args.noise,
+        faults=Faults(args.garble, args.nan_channels, args.nan_rate, args.latency_rate, args.latency),
+    )
+    server = PtyServer(emulator, baudrate=args.baud)
+    server.start()
+    print("TMS emulator listening on " + server.port)
+
+    if args.gui:
+        sys.exit(run_gui(server.port))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,213 @@
+import json
+from numpy import arange, array, column_stack, dtype, empty, frombuffer, nan, uint16, zeros
+
+
+# thermocouple channels reported by the TMS device, in wire order
+CHANNELS = ("T1", "T2", "T3", "T4", "T5", "T6")
+
+# columns of a parsed measurement: sequence number since START, device time stamp (millis()) and channels
+MEASUREMENT_FIELDS = ("seq", "t") + CHANNELS
+SEQUENCE_MODULO = 1 << 16
+STAMP_MODULO = 1 << 32
+
+# replies that end a GETALL/GETN response
+END_OF_BATCH = "EOB"
+BUFFER_EMPTY = "BE"
+BUFFER_FULL = "BF"
+
+# replies that answer each control command (first word of the command)
+EXPECTED_REPLIES = {
+    "START": ("STAOK",),
+    "STOP": ("STOOK",),
+    "SETS": ("SSOK", "SSNOK"),
+    "SETA": ("SAOK", "SANOK"),
+    "BSIZE": ("BSOK", "BSNOK"),
+    "CLEAR": ("CLROK",),
+    "MODE": ("MBOK", "MJOK", "MNOK"),
+}
+
+# commands answered with measurements
+MEASUREMENT_COMMANDS = ("GET", "GETALL", "GETN")
+
+# queue occupancy and capacity, answered with "ST <items> <capacity>"
+STATUS = "STATUS"
+STATUS_REPLY = "ST "
+
+# binary mode, see multimax_spi.h for the frame layout
+BINARY_MODE = "MODE BIN"
+BINARY_MODE_OK = "MBOK"
+JSON_MODE = "MODE JSON"
+JSON_MODE_OK = "MJOK"
+BATCH_HEADER = "B "
+FRAME_SYNC = b"\xa5\x5a"
+FRAME_SIZE = 23
+FRAME_DTYPE = dtype([
+    ("sync", "u1", (2,)),
+    ("seq", "<u2"),
+    ("stamp", "<u4"),
+    ("raw", "<u2", (6,)),
+    ("open", "u1"),
+    ("crc", "<u2"),
+])
+TEMPERATURE_RESOLUTION = 0.25  # Celsius per unit of a raw MAX6675 reading
+
+
+def _crc_xmodem_table():
+    table = zeros(256, dtype=uint16)
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else crc << 1
+        table[byte] = crc & 0xFFFF
+    return table
+
+
+_CRC_TABLE = _crc_xmodem_table()
+
+
+def accepted_reply(command):
+    """Reply by which the device accepts a control command (the first expected reply)."""
+    return EXPECTED_REPLIES[command.split()[0]][0]
+
+
+def channel_names(n_devices=1):
+    """Column names of every thermocouple: T1..T6 for a single device and
+    D1-T1..DN-T6 when several devices are acquired together."""
+    if n_devices == 1:
+        return list(CHANNELS)
+    return ["D{}-{}".format(device + 1, key) for device in range(n_devices) for key in CHANNELS]
+
+
+def batch_command(max_items=None):
+    """Command that drains up to max_items queued measurements (all of them if None)."""
+    if max_items is None:
+        return "GETALL"
+    return "GETN " + str(int(max_items))
+
+
+def parse_measurement(line):
+    """Parse one JSON measurement line into a list of MEASUREMENT_FIELDS values."""
+    values = json.loads(line)
+    return [values[key] for key in MEASUREMENT_FIELDS]
+
+
+def parse_measurements(lines):
+    """Parse a batch of JSON measurement lines into a (samples x MEASUREMENT_FIELDS) array.
+
+    The whole batch is decoded with a single json.loads call. If any line is
+    malformed the batch is parsed line by line and the broken measurements are
+    dropped, their sequence numbers leave a gap. Returns the array and the
+    number of failed lines.
+    """
+    if not lines:
+        return empty((0, len(MEASUREMENT_FIELDS))), 0
+
+    try:
+        batch = json.loads("[" + ",".join(lines) + "]")
+        return array([[m[key] for key in MEASUREMENT_FIELDS] for m in batch], dtype=float), 0
+
+    except (ValueError, KeyError, TypeError):
+        values = []
+        for line in lines:
+            try:
+                values.append(parse_measurement(line))
+            except (ValueError, KeyError, TypeError):
+                pass
+        return array(values, dtype=float).reshape(-1, len(MEASUREMENT_FIELDS)), len(lines) - len(values)
+
+
+def frame_crc(frames):
+    """CRC-16/XMODEM of every frame in a (frames x FRAME_SIZE) uint8 array.
+
+    The CRC is advanced one byte position at a time for all frames together,
+    so the cost does not depend on running Python code per frame.
+    """
+    crc = zeros(frames.shape[0], dtype=uint16)
+    for column in range(2, FRAME_SIZE - 2):
+        crc = (crc << 8) ^ _CRC_TABLE[(crc >> 8) ^ frames[:, column]]
+    return crc
+
+
+def _split_frames(data):
+    # fast path: the buffer is a clean sequence of frames
+    if len(data) % FRAME_SIZE == 0:
+        frames = frombuffer(data, dtype="u1").reshape(-1, FRAME_SIZE)
+        if (frames[:, 0] == FRAME_SYNC[0]).all() and (frames[:, 1] == FRAME_SYNC[1]).all():
+            return frames
+
+    # resynchronize on the sync bytes, skipping garbage in between
+    chunks = []
+    start = data.find(FRAME_SYNC)
+    while start != -1 and start + FRAME_SIZE <= len(data):
+        chunks.append(data[start:start + FRAME_SIZE])
+        start = data.find(FRAME_SYNC, start + FRAME_SIZE)
+    return frombuffer(b"".join(chunks), dtype="u1").reshape(-1, FRAME_SIZE)
+
+
+def decode_frames(data, n_expected=None):
+    """Decode a buffer of binary frames.
+
+    Returns a (samples x MEASUREMENT_FIELDS) array, with NaN on open
+    thermocouples, and the number of frames that were lost to bad sync bytes
+    or CRC errors (relative to n_expected when it is given).
+    """
+    frames = _split_frames(bytes(data))
+    valid = frame_crc(frames) == frames[:, FRAME_SIZE - 2:].copy().view("<u2")[:, 0]
+    records = frames[valid].copy().view(FRAME_DTYPE)[:, 0]
+
+    values = records["raw"] * TEMPERATURE_RESOLUTION
+    values[(records["open"][:, None] >> arange(len(CHANNELS))) & 1 == 1] = nan
+
+    if n_expected is None:
+        n_expected = frames.shape[0]
+    return column_stack([records["seq"], records["stamp"], values]), max(n_expected - len(records), 0)
+
+
+def parse_status(line):
+    """Parse a STATUS reply into (queued items, queue capacity); None if malformed."""
+    fields = line[len(STATUS_REPLY):].split()
+    if not line.startswith(STATUS_REPLY) or len(fields) != 2 or not all(f.isdigit() for f in fields):
+        return None
+    return int(fields[0]), int(fields[1])
+
+
+def read_line(serial_port):
+    """Read one reply line; returns None when the read timed out."""
+    res = serial_port.readline()
+    if not res:
+        return None
+    return res.decode("utf-8", errors="replace").split("\r")[0].strip()
+
+
+def read_batch(serial_port, binary=False):
+    """Read a GETALL/GETN response, in JSON or binary mode.
+
+    Returns a (status, values, failed) tuple. status is END_OF_BATCH when the
+    batch was complete, BUFFER_EMPTY when there was nothing queued, or None
+    when the port timed out mid-batch. A "BF" printed by the device before the
+    batch is reported as BUFFER_FULL once the rest of the batch has been read,
+    so no measurement is left behind in the port. values is a (samples x
+    MEASUREMENT_FIELDS) array and failed the number of measurements that were
+    lost.
+    """
+    lines = []
+    full_reported = False
+    while True:
+        res = read_line(serial_port)
+        if res is None:
+            values, failed = parse_measurements(lines)
+            return None, values, failed
+        if res == BUFFER_FULL:
+            full_reported = True
+        elif res == BUFFER_EMPTY or res == END_OF_BATCH:
+            values, failed = parse_measurements(lines)
+            return (BUFFER_FULL if full_reported else res), values, failed
+        elif binary and res.startswith(BATCH_HEADER) and res[len(BATCH_HEADER):].isdigit():
+            n_frames = int(res[len(BATCH_HEADER):])
+            data = serial_port.read(n_frames * FRAME_SIZE)
+            values, failed = decode_frames(data, n_frames)
+            if len(data) < n_frames * FRAME_SIZE:
+                return None, values, failed
+            return (BUFFER_FULL if full_reported else END_OF_BATCH), values, failed
+        elif res:
+            lines.append(res)